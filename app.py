@@ -1,17 +1,14 @@
-import json
-import os
-import re
 import time
-import uuid
+from datetime import datetime
 
 import streamlit as st
 
-from data_utils import (add_request, generate_request_id, get_on_duty_managers,
-                        load_requests)
-from email_utils import send_approval_email
-from nlu import classify_intent, extract_slots
+from data_utils import find_request_by_id
+from email_utils import APPROVAL_BASE_URL
+from intake import INTAKE_URL, submit, submit_remote
 from route_optimizer import compute_delivery_route
 from scheduler import start_scheduler
+from status_feed import wait_for_status_change
 
 # --- THEME SETTINGS ---
 st.set_page_config(
@@ -73,15 +70,6 @@ st.markdown("""
 # Start scheduler in background
 start_scheduler()
 
-# --- SLOT EXTRACTION IMPROVEMENT ---
-def extract_direct_slots(text, slots):
-    # Look for patterns like "field: value"
-    for field in slots.keys():
-        match = re.search(rf"{field}:\s*([^\n,]+)", text, re.IGNORECASE)
-        if match:
-            slots[field] = match.group(1).strip()
-    return slots
-
 # Chat history in session
 if 'history' not in st.session_state:
     st.session_state['history'] = []
@@ -92,70 +80,64 @@ lookup_id = st.sidebar.text_input("Enter Request ID")
 if st.sidebar.button("Check Status") and lookup_id:
     found = False
     for req_type in ['resource', 'service']:
-        reqs = load_requests(req_type)
-        for req in reqs:
-            if req.get('request_id') == lookup_id:
-                st.sidebar.success(f"Status: {req.get('status')}")
-                st.sidebar.json(req)
-                found = True
-                break
+        req = find_request_by_id(req_type, lookup_id)
+        if req:
+            st.sidebar.success(f"Status: {req.get('status')}")
+            st.sidebar.json(req)
+            found = True
+            break
     if not found:
         st.sidebar.error("Request ID not found.")
 
 # --- POLLING FOR STATUS UPDATE ---
 # Support polling for multiple request IDs (hybrid requests)
+any_pending = False
+# (status, has driver) per request as rendered by this run
+rendered_states = {}
 if 'last_request_ids' in st.session_state:
     req_ids = st.session_state['last_request_ids']
     if not isinstance(req_ids, list):
         req_ids = [req_ids]
     last_statuses = st.session_state.get('last_known_statuses', {})
-    any_pending = False
     for req_id in req_ids:
-        found = False
         for req_type in ['resource', 'service']:
-            reqs = load_requests(req_type)
-            for req in reqs:
-                if req.get('request_id') == req_id:
-                    found = True
-                    current_status = req.get('status')
-                    approver = req.get('approved_by', {})
-                    approver_name = approver.get('name') if isinstance(approver, dict) and approver else None
-                    # Remove 'Bot: typing...' if present and status is not Pending
-                    if st.session_state['history'] and st.session_state['history'][-1]['content'] == 'Bot: typing...' and current_status in ['Approved', 'Rejected']:
-                        st.session_state['history'].pop()
-                    if req_id not in last_statuses or current_status != last_statuses[req_id]:
-                        if current_status in ['Approved', 'Rejected']:
-                            if approver_name:
-                                msg = f"🟢 Your request {req_id} was <b>{current_status}</b> by <b>{approver_name}</b>." if current_status == 'Approved' else f"🔴 Your request {req_id} was <b>{current_status}</b> by <b>{approver_name}</b>."
-                            else:
-                                msg = f"🟢 Your request {req_id} was <b>{current_status}</b> by the manager." if current_status == 'Approved' else f"🔴 Your request {req_id} was <b>{current_status}</b> by the manager."
+            req = find_request_by_id(req_type, req_id)
+            if not req:
+                continue
+            current_status = req.get('status')
+            approver = req.get('approved_by', {})
+            approver_name = approver.get('name') if isinstance(approver, dict) and approver else None
+            # Remove 'Bot: typing...' if present and status is not Pending
+            if st.session_state['history'] and st.session_state['history'][-1]['content'] == 'Bot: typing...' and current_status in ['Approved', 'Rejected']:
+                st.session_state['history'].pop()
+            if req_id not in last_statuses or current_status != last_statuses[req_id]:
+                if current_status in ['Approved', 'Rejected']:
+                    if approver_name:
+                        msg = f"🟢 Your request {req_id} was <b>{current_status}</b> by <b>{approver_name}</b>." if current_status == 'Approved' else f"🔴 Your request {req_id} was <b>{current_status}</b> by <b>{approver_name}</b>."
+                    else:
+                        msg = f"🟢 Your request {req_id} was <b>{current_status}</b> by the manager." if current_status == 'Approved' else f"🔴 Your request {req_id} was <b>{current_status}</b> by the manager."
                             
-                            # Add driver assignment info if approved and assigned
-                            if current_status == 'Approved' and req.get('assigned_driver'):
-                                driver_info = req['assigned_driver']
-                                msg += f"<br>🚚 <b>Assigned Driver:</b> {driver_info['name']} ({driver_info['email']})"
-                                # Notify requester that driver is on the way (only once per request)
-                                driver_msg = f"{driver_info['name']} received your request and is coming to you."
-                                if not any(driver_msg in h['content'] for h in st.session_state['history'] if h['role'] == 'assistant'):
-                                    st.session_state['history'].append({'role': 'assistant', 'content': driver_msg})
-                            st.session_state['history'].append({'role': 'assistant', 'content': msg})
-                        last_statuses[req_id] = current_status
-                    # Always check for new driver assignment and notify if not already shown
+                    # Add driver assignment info if approved and assigned
                     if current_status == 'Approved' and req.get('assigned_driver'):
                         driver_info = req['assigned_driver']
+                        msg += f"<br>🚚 <b>Assigned Driver:</b> {driver_info['name']} ({driver_info['email']})"
+                        # Notify requester that driver is on the way (only once per request)
                         driver_msg = f"{driver_info['name']} received your request and is coming to you."
                         if not any(driver_msg in h['content'] for h in st.session_state['history'] if h['role'] == 'assistant'):
                             st.session_state['history'].append({'role': 'assistant', 'content': driver_msg})
-                    if current_status == 'Pending' or (current_status == 'Approved' and not req.get('assigned_driver')):
-                        any_pending = True
-                    break
-            if found:
-                break
+                    st.session_state['history'].append({'role': 'assistant', 'content': msg})
+                last_statuses[req_id] = current_status
+            # Always check for new driver assignment and notify if not already shown
+            if current_status == 'Approved' and req.get('assigned_driver'):
+                driver_info = req['assigned_driver']
+                driver_msg = f"{driver_info['name']} received your request and is coming to you."
+                if not any(driver_msg in h['content'] for h in st.session_state['history'] if h['role'] == 'assistant'):
+                    st.session_state['history'].append({'role': 'assistant', 'content': driver_msg})
+            if current_status == 'Pending' or (current_status == 'Approved' and not req.get('assigned_driver')):
+                any_pending = True
+            rendered_states[req_id] = (current_status, bool(req.get('assigned_driver')))
+            break
     st.session_state['last_known_statuses'] = last_statuses
-    # Poll every 1 second if any are still pending
-    if any_pending:
-        time.sleep(1)
-        st.rerun()
 
 # --- CHAT UI ---
 for msg in st.session_state['history']:
@@ -173,158 +155,86 @@ if user_input:
     # Show 'Bot: typing...' message
     st.session_state['history'].append({'role': 'assistant', 'content': 'Bot: typing...'})
     st.chat_message('assistant').markdown('Bot: typing...')
-    # NLU
-    intent = classify_intent(user_input)
-    slots = extract_slots(user_input)
-    slots = extract_direct_slots(user_input, slots)
-    # --- Check for missing info and prompt accordingly ---
-    missing = []
-    if intent == "resource":
-        if not slots.get("items") or len(slots["items"]) == 0:
-            missing.append("resource, quantity, destination")
-        else:
-            if not slots.get("base_location"):
-                missing.append("base location")
-            if not slots.get("destination"):
-                missing.append("destination")
-        if missing:
-            bot_msg = f"⚠️ I need more info: {', '.join(missing)}. Please provide these (e.g., '5 radios from HQ to Outpost Alpha')."
-            st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
-            st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
-            st.stop()
-    elif intent == "service":
-        if not slots.get("services") or len(slots["services"]) == 0:
-            missing.append("service action(s) and target(s)")
-        if not slots.get("location"):
-            missing.append("location")
-        if missing:
-            bot_msg = f"⚠️ I need more info: {', '.join(missing)}. Please provide these (e.g., 'repair the generator at Outpost Bravo')."
-            st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
-            st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
-            st.stop()
-    # Find on-duty managers
-    on_duty_managers = get_on_duty_managers()
-    if not on_duty_managers:
-        bot_msg = "<span style='color:#ffcc00'>⚠️ No manager is currently on duty. Your request will be queued for the next available manager.</span>"
+    # Intake (NLU, missing-info check, request creation, approval emails) runs on the
+    # approval server; in-process if the server is not reachable
+    request_date = st.session_state.get('today', '2025-07-01')
+    result = submit_remote(INTAKE_URL, user_input, request_date) or submit(user_input, request_date)
+    if result['status'] == 'error':
+        # The server got the message but did not confirm it; resubmitting could duplicate the request
+        bot_msg = f"⚠️ The request server did not confirm your request ({result['error']}). It may still have been created; check its status before sending it again."
         st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
         st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
-    manager_list = [{"name": m["name"], "email": m["email"]} for m in on_duty_managers]
-    created_ids = []
-    # Hybrid: both resource and service in one message
-    if slots.get('items') and slots.get('services'):
-        # Resource request
-        resource_request_id = generate_request_id('resource')
-        resource_request = {
-            "request_id": resource_request_id,
-            "items": slots.get('items', []),
-            "base_location": slots['base_location'],
-            "destination": slots['destination'],
-            "managers": manager_list,
-            "approved_by": None,
-            "delivery_person": {"name": None, "email": None},
-            "delivery_route": [],
-            "request_date": str(st.session_state.get('today', '2025-07-01')),
-            "close_date": None,
-            "status": "Pending",
-            "priority": slots.get('priority', 0)
-        }
-        add_request('resource', resource_request)
-        # Service request
-        service_request_id = generate_request_id('service')
-        service_request = {
-            "request_id": service_request_id,
-            "services": slots.get('services', []),
-            "description": slots['description'],
-            "location": slots['location'],
-            "requester": slots['requester'],
-            "managers": manager_list,
-            "approved_by": None,
-            "quality_engineer": None,
-            "service_engineer": None,
-            "request_date": str(st.session_state.get('today', '2025-07-01')),
-            "close_date": None,
-            "status": "Pending"
-        }
-        add_request('service', service_request)
-        # Send approval emails for both
-        tokens_path = 'data/approval_tokens.json'
-        if not os.path.exists(tokens_path):
-            with open(tokens_path, 'w') as f:
-                json.dump({}, f)
-        with open(tokens_path, 'r') as f:
-            tokens = json.load(f)
-        for m in manager_list:
-            # Resource
-            token_r = str(uuid.uuid4())
-            tokens[token_r] = {'type': 'resource', 'id': resource_request_id, 'manager_email': m['email'], 'manager_name': m['name']}
-            send_approval_email(resource_request, token_r, 'resource', m['email'])
-            # Service
-            token_s = str(uuid.uuid4())
-            tokens[token_s] = {'type': 'service', 'id': service_request_id, 'manager_email': m['email'], 'manager_name': m['name']}
-            send_approval_email(service_request, token_s, 'service', m['email'])
-        with open(tokens_path, 'w') as f:
-            json.dump(tokens, f, indent=2)
-        bot_msg = f"<span style='color:#b3c686'>✅ Your <b>resource</b> request has been created with ID <b>{resource_request_id}</b> and your <b>service</b> request with ID <b>{service_request_id}</b>. Both have been sent for manager approval.</span>"
+        st.stop()
+    # --- Check for missing info and prompt accordingly ---
+    if result['status'] == 'incomplete':
+        example = '5 radios from HQ to Outpost Alpha' if result['intent'] == 'resource' else 'repair the generator at Outpost Bravo'
+        bot_msg = f"⚠️ I need more info: {', '.join(result['missing'])}. Please provide these (e.g., '{example}')."
         st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
         st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
-        # Store last request for polling (resource by default)
-        st.session_state['last_request_ids'] = [resource_request_id, service_request_id]
-        st.session_state['last_known_statuses'] = {resource_request_id: "Pending", service_request_id: "Pending"}
-        st.session_state['history'].append({'role': 'assistant', 'content': 'Bot: typing...'})
-        st.chat_message('assistant').markdown('Bot: typing...')
-    else:
-        # Only one type present, proceed as before
-        if slots.get('items'):
-            intent = 'resource'
-            request_id = generate_request_id(intent)
-            request = {
-                "request_id": request_id,
-                "items": slots.get('items', []),
-                "base_location": slots['base_location'],
-                "destination": slots['destination'],
-                "managers": manager_list,
-                "approved_by": None,
-                "delivery_person": {"name": None, "email": None},
-                "delivery_route": [],
-                "request_date": str(st.session_state.get('today', '2025-07-01')),
-                "close_date": None,
-                "status": "Pending",
-                "priority": slots.get('priority', 0)
-            }
+        st.stop()
+    # No manager on duty: the request was still created and waits for the next shift
+    next_on_duty = result['next_on_duty']
+    if next_on_duty is not None:
+        if next_on_duty['managers']:
+            next_names = ', '.join(next_on_duty['managers'])
+            next_start = datetime.fromisoformat(next_on_duty['start'])
+            bot_msg = f"<span style='color:#ffcc00'>⚠️ No manager is currently on duty. Your request will be queued for the next available manager ({next_names}, on duty from {next_start.strftime('%a %H:%M')}).</span>"
         else:
-            intent = 'service'
-            request_id = generate_request_id(intent)
-            request = {
-                "request_id": request_id,
-                "services": slots.get('services', []),
-                "description": slots['description'],
-                "location": slots['location'],
-                "requester": slots['requester'],
-                "managers": manager_list,
-                "approved_by": None,
-                "quality_engineer": None,
-                "service_engineer": None,
-                "request_date": str(st.session_state.get('today', '2025-07-01')),
-                "close_date": None,
-                "status": "Pending"
-            }
-        add_request(intent, request)
-        tokens_path = 'data/approval_tokens.json'
-        if not os.path.exists(tokens_path):
-            with open(tokens_path, 'w') as f:
-                json.dump({}, f)
-        with open(tokens_path, 'r') as f:
-            tokens = json.load(f)
-        for m in manager_list:
-            token = str(uuid.uuid4())
-            tokens[token] = {'type': intent, 'id': request_id, 'manager_email': m['email'], 'manager_name': m['name']}
-            send_approval_email(request, token, intent, m['email'])
-        with open(tokens_path, 'w') as f:
-            json.dump(tokens, f, indent=2)
-        bot_msg = f"<span style='color:#b3c686'>✅ Your <b>{intent}</b> request has been created with ID <b>{request_id}</b> and sent for manager approval.</span>"
+            bot_msg = "<span style='color:#ffcc00'>⚠️ No manager is currently on duty. Your request will be queued for the next available manager.</span>"
         st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
         st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
-        st.session_state['last_request_ids'] = [request_id]
-        st.session_state['last_known_statuses'] = {request_id: "Pending"}
-        st.session_state['history'].append({'role': 'assistant', 'content': 'Bot: typing...'})
-        st.chat_message('assistant').markdown('Bot: typing...')
+    created = {r['type']: r['request_id'] for r in result['requests']}
+    if len(created) == 2:
+        # Hybrid: both resource and service in one message
+        bot_msg = f"<span style='color:#b3c686'>✅ Your <b>resource</b> request has been created with ID <b>{created['resource']}</b> and your <b>service</b> request with ID <b>{created['service']}</b>. Both have been sent for manager approval.</span>"
+    else:
+        intent, request_id = next(iter(created.items()))
+        bot_msg = f"<span style='color:#b3c686'>✅ Your <b>{intent}</b> request has been created with ID <b>{request_id}</b> and sent for manager approval.</span>"
+    st.session_state['history'].append({'role': 'assistant', 'content': bot_msg})
+    st.chat_message('assistant').markdown(bot_msg, unsafe_allow_html=True)
+    # Store the new requests for polling
+    st.session_state['last_request_ids'] = [r['request_id'] for r in result['requests']]
+    any_pending = True
+    st.session_state['last_known_statuses'] = {request_id: "Pending" for request_id in st.session_state['last_request_ids']}
+    st.session_state['history'].append({'role': 'assistant', 'content': 'Bot: typing...'})
+    st.chat_message('assistant').markdown('Bot: typing...')
+
+# --- WAIT FOR STATUS CHANGES ---
+# Block on the approval server's status feed until one of our requests changes,
+# then rerun to render it; waits that time out just wait again. Falls back to
+# 1-second polling of the stored statuses if the server is unreachable.
+# Each wait is kept short so a new chat message is not held up behind it for long.
+STATUS_WAIT_SECONDS = 5
+
+def request_states(req_ids):
+    states = {}
+    for req_id in req_ids:
+        for req_type in ['resource', 'service']:
+            req = find_request_by_id(req_type, req_id)
+            if req:
+                states[req_id] = (req.get('status'), bool(req.get('assigned_driver')))
+                break
+    return states
+
+if any_pending:
+    req_ids = st.session_state['last_request_ids']
+    cursor = st.session_state.get('status_cursor')
+    # Touching a placeholder between waits lets Streamlit interrupt the loop for a new message
+    waiting = st.empty()
+    while True:
+        waiting.empty()
+        result = wait_for_status_change(APPROVAL_BASE_URL, req_ids, cursor, timeout=STATUS_WAIT_SECONDS)
+        if result is None:
+            time.sleep(1)
+        else:
+            # Without a cursor the server returns one at once; a change from before it
+            # is not an event, so it is caught by comparing the statuses below
+            first = cursor is None
+            cursor = st.session_state['status_cursor'] = result['cursor']
+            if result['events'] or result['reset']:
+                break
+            if not first:
+                continue
+        if request_states(req_ids) != rendered_states:
+            break
+    st.rerun()
@@ -1,33 +1,41 @@
-import json
-import os
 from datetime import datetime
 
-from flask import Flask, render_template_string
+import hmac
+import json
+
+from flask import Flask, Response, jsonify, render_template_string
 from flask import request as flask_request
 
-from data_utils import get_on_duty_drivers, load_requests, update_request_by_id
+from data_utils import (apply_request_update, cache_stats, find_request_by_id,
+                        get_driver_by_email, get_on_duty_drivers, load_requests,
+                        publish_status_change, update_request_by_id)
 from email_utils import send_driver_assignment_email
+from generate_route import prewarm as prewarm_routes
+from intake import INTAKE_SECRET, submit
+from status_feed import feed
+from token_store import approval_tokens, backfill_driver_tokens, driver_tokens
 
 app = Flask(__name__)
-TOKEN_FILE = 'data/approval_tokens.json'
-
-# Utility to load/save tokens
-def load_tokens():
-    if not os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'w') as f:
-            json.dump({}, f)
-    with open(TOKEN_FILE, 'r') as f:
-        return json.load(f)
 
-def save_tokens(tokens):
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump(tokens, f, indent=2)
+def _apply_decision(token, req_info, updater):
+    """
+    Write a manager's decision; if the write fails, put the token back so the link
+    still works. Subscribers are told only after the write, so a failure to notify
+    them cannot re-arm a token whose decision is already stored.
+    """
+    try:
+        _, change = apply_request_update(req_info['type'], req_info['id'], updater)
+    except Exception:
+        approval_tokens.restore(token, req_info)
+        raise
+    publish_status_change(req_info['type'], req_info['id'], change)
 
 @app.route('/approve')
 def approve():
     token = flask_request.args.get('token')
-    tokens = load_tokens()
-    req_info = tokens.get(token)
+    # Consume up front so a double click or a second tab cannot process the same token twice;
+    # _apply_decision restores it if the status update fails
+    req_info = approval_tokens.consume(token)
     if not req_info:
         return render_template_string('<h3>Invalid or expired token.</h3>')
     req_type, req_id = req_info['type'], req_info['id']
@@ -41,15 +49,10 @@ def approve():
         return r
     
     # Update the request
-    update_request_by_id(req_type, req_id, updater)
+    _apply_decision(token, req_info, updater)
     
     # Get the updated request to send to drivers
-    requests = load_requests(req_type)
-    updated_request = None
-    for req in requests:
-        if req.get('request_id') == req_id:
-            updated_request = req
-            break
+    updated_request = find_request_by_id(req_type, req_id)
     
     # Notify on-duty drivers
     if updated_request:
@@ -68,16 +71,14 @@ def approve():
                 return r
             update_request_by_id(req_type, req_id, save_driver_tokens)
     
-    # Invalidate token
-    tokens.pop(token)
-    save_tokens(tokens)
     return render_template_string('<h3>Request {{rid}} approved by {{mgr}}. Drivers have been notified!</h3>', rid=req_id, mgr=manager_name)
 
 @app.route('/reject')
 def reject():
     token = flask_request.args.get('token')
-    tokens = load_tokens()
-    req_info = tokens.get(token)
+    # Consume up front so a double click or a second tab cannot process the same token twice;
+    # _apply_decision restores it if the status update fails
+    req_info = approval_tokens.consume(token)
     if not req_info:
         return render_template_string('<h3>Invalid or expired token.</h3>')
     req_type, req_id = req_info['type'], req_info['id']
@@ -88,10 +89,7 @@ def reject():
         r['close_date'] = None
         r['approved_by'] = {'name': manager_name, 'email': manager_email}
         return r
-    update_request_by_id(req_type, req_id, updater)
-    # Invalidate token
-    tokens.pop(token)
-    save_tokens(tokens)
+    _apply_decision(token, req_info, updater)
     return render_template_string('<h3>Request {{rid}} rejected by {{mgr}}.</h3>', rid=req_id, mgr=manager_name)
 
 @app.route('/accept_delivery')
@@ -100,25 +98,13 @@ def accept_delivery():
     if not token:
         return render_template_string('<h3>Invalid token.</h3>')
     
-    # Find the request with this token
-    found_request = None
-    found_type = None
-    
-    for req_type in ['resource', 'service']:
-        requests = load_requests(req_type)
-        for req in requests:
-            if req.get('status') == 'Approved' and 'driver_tokens' in req:
-                for driver_email, driver_token in req['driver_tokens'].items():
-                    if driver_token == token:
-                        found_request = req
-                        found_type = req_type
-                        break
-                if found_request:
-                    break
-        if found_request:
-            break
-    
-    if not found_request:
+    # Resolve the token through the driver token index
+    token_info = driver_tokens.get(token)
+    if not token_info:
+        return render_template_string('<h3>Invalid or expired token.</h3>')
+    found_type = token_info['type']
+    found_request = find_request_by_id(found_type, token_info['id'])
+    if not found_request or found_request.get('status') != 'Approved':
         return render_template_string('<h3>Invalid or expired token.</h3>')
     
     # Check if already assigned
@@ -126,31 +112,28 @@ def accept_delivery():
         return render_template_string('<h3>This assignment has already been accepted by another driver.</h3>')
     
     # Find the driver who accepted
-    accepting_driver = None
-    for driver_email, driver_token in found_request['driver_tokens'].items():
-        if driver_token == token:
-            # Find driver details
-            from data_utils import load_drivers
-            drivers = load_drivers()
-            for driver in drivers:
-                if driver['email'] == driver_email:
-                    accepting_driver = driver
-                    break
-            break
+    accepting_driver = get_driver_by_email(token_info['driver_email'])
     
     if not accepting_driver:
         return render_template_string('<h3>Driver not found.</h3>')
     
-    # Assign the driver to the request
+    # Assign the driver to the request; re-checked inside the update so two
+    # simultaneous acceptances cannot both win
+    assigned = []
     def updater(r):
+        if r.get('assigned_driver'):
+            return r
         r['assigned_driver'] = {
             'name': accepting_driver['name'],
             'email': accepting_driver['email']
         }
         r['assignment_date'] = str(datetime.now())
+        assigned.append(True)
         return r
     
     update_request_by_id(found_type, found_request['request_id'], updater)
+    if not assigned:
+        return render_template_string('<h3>This assignment has already been accepted by another driver.</h3>')
     
     return render_template_string('''
     <h3>Assignment Accepted!</h3>
@@ -160,5 +143,59 @@ def accept_delivery():
     <p><strong>Assigned Driver:</strong> {{driver_name}}</p>
     ''', rid=found_request['request_id'], driver_name=accepting_driver['name'])
 
+def _subscription_args():
+    ids = [i for i in flask_request.args.get('ids', '').split(',') if i]
+    since = flask_request.args.get('since')
+    timeout = min(float(flask_request.args.get('timeout', 25)), 60.0)
+    return ids, since, timeout
+
+@app.route('/status_events')
+def status_events():
+    """Long-poll: returns as soon as one of `ids` changes after cursor `since`, or after `timeout` seconds."""
+    ids, since, timeout = _subscription_args()
+    return jsonify(feed.wait_for(ids, since, timeout))
+
+@app.route('/status_stream')
+def status_stream():
+    """Server-sent events for status changes of `ids`; each event's id is the feed cursor."""
+    ids, since, timeout = _subscription_args()
+    def stream(cursor):
+        if not cursor:
+            cursor = feed.wait_for(ids)['cursor']
+        while True:
+            result = feed.wait_for(ids, cursor, timeout)
+            cursor = result['cursor']
+            if result['reset']:
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+            for event in result['events']:
+                yield f"id: {cursor}\ndata: {json.dumps(event)}\n\n"
+            if not result['events'] and not result['reset']:
+                yield ": keepalive\n\n"
+    return Response(stream(since or flask_request.headers.get('Last-Event-ID')), mimetype='text/event-stream')
+
+def _intake_allowed():
+    """The shared secret when INTAKE_SECRET is set, otherwise only local callers."""
+    if INTAKE_SECRET:
+        return hmac.compare_digest(flask_request.headers.get('X-Intake-Token', ''), INTAKE_SECRET)
+    return flask_request.remote_addr in ('127.0.0.1', '::1')
+
+@app.route('/intake', methods=['POST'])
+def intake_request():
+    if not _intake_allowed():
+        return jsonify({'error': 'forbidden'}), 403
+    body = flask_request.get_json(silent=True) or {}
+    text = (body.get('text') or '').strip()
+    if not text:
+        return jsonify({'error': "'text' is required"}), 400
+    return jsonify(submit(text, body.get('request_date'), send=body.get('send_email', True)))
+
+@app.route('/cache_stats')
+def request_cache_stats():
+    return jsonify(cache_stats())
+
 if __name__ == '__main__':
+    # One-time import of acceptance tokens issued before the driver token index existed
+    backfill_driver_tokens({t: load_requests(t) for t in ['resource', 'service']})
+    # Build every destination's supply graph and route table before the first driver email
+    prewarm_routes()
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
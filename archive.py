@@ -0,0 +1,100 @@
+import glob
+import gzip
+import json
+import os
+import re
+import threading
+
+from file_utils import file_lock
+
+ARCHIVE_DIR = os.path.join('data', 'archive')
+TERMINAL_STATUSES = {'Rejected'}
+REQUEST_ID_YEAR = re.compile(r'^[RS]-(\d{4})-')
+
+
+def is_closed(request):
+    """Closed work: rejected, or approved with a driver already assigned."""
+    status = request.get('status')
+    return status in TERMINAL_STATUSES or (status == 'Approved' and bool(request.get('assigned_driver')))
+
+
+def _month(request):
+    request_date = request.get('request_date') or ''
+    if re.match(r'^\d{4}-\d{2}', request_date):
+        return request_date[:7]
+    match = REQUEST_ID_YEAR.match(request.get('request_id') or '')
+    return f"{match.group(1)}-00" if match else 'unknown'
+
+
+def segment_path(request_type, month):
+    return os.path.join(ARCHIVE_DIR, f"{request_type}-{month}.jsonl.gz")
+
+
+def write_segments(request_type, requests):
+    """Append requests to their monthly gzip JSONL segments (one gzip member per call)."""
+    by_month = {}
+    for req in requests:
+        by_month.setdefault(_month(req), []).append(req)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, reqs in by_month.items():
+        path = segment_path(request_type, month)
+        with file_lock(path):
+            with gzip.open(path, 'at') as f:
+                f.write(''.join(json.dumps(req) + '\n' for req in reqs))
+
+
+def iter_segment(path):
+    with gzip.open(path, 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def list_segments(request_type, year=None):
+    pattern = f"{request_type}-{year}-*.jsonl.gz" if year else f"{request_type}-*.jsonl.gz"
+    return sorted(glob.glob(os.path.join(ARCHIVE_DIR, pattern)))
+
+
+# Per-segment set of request ids, reused until the segment file changes
+_segment_ids = {}
+_segment_ids_lock = threading.Lock()
+
+
+def _ids_in_segment(path):
+    st = os.stat(path)
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _segment_ids_lock:
+        cached = _segment_ids.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    ids = {req.get('request_id') for req in iter_segment(path)}
+    with _segment_ids_lock:
+        _segment_ids[path] = (signature, ids)
+    return ids
+
+
+def find_archived(request_type, request_id):
+    """
+    Look a request up in the cold segments. Segments from the year in the id
+    (R-2025-...) are searched first, then the rest.
+    """
+    match = REQUEST_ID_YEAR.match(request_id or '')
+    year = match.group(1) if match else None
+    candidates = list_segments(request_type, year) if year else []
+    candidates += [p for p in list_segments(request_type) if p not in candidates]
+    for path in candidates:
+        if request_id not in _ids_in_segment(path):
+            continue
+        found = None
+        for req in iter_segment(path):
+            if req.get('request_id') == request_id:
+                found = req  # keep the last copy if a crash left a duplicate
+        return found
+    return None
+
+
+if __name__ == '__main__':
+    from data_utils import archive_closed_requests
+
+    for request_type, count in archive_closed_requests().items():
+        print(f"Archived {count} closed {request_type} requests into {ARCHIVE_DIR}")
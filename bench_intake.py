@@ -0,0 +1,94 @@
+"""
+End-to-end intake load test: fires many concurrent chat messages at the approval
+server's /intake endpoint (or at intake.submit in-process) and reports throughput,
+latency and outcomes. Approval emails are not sent unless --email is given.
+
+Requests created by a run are real: point STORAGE_BACKEND / the data directory
+at a scratch copy first.
+
+    python bench_intake.py [--requests 500] [--concurrency 50] [--url http://localhost:5000]
+    python bench_intake.py --in-process
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from intake import INTAKE_SECRET, INTAKE_URL
+
+CORPUS_FILE = os.path.join('data', 'nlu_corpus.jsonl')
+
+
+def load_messages(path):
+    with open(path, 'r') as f:
+        return [json.loads(line)['text'] for line in f if line.strip()]
+
+
+def http_submitter(base_url, send):
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_maxsize=256))
+    if INTAKE_SECRET:
+        session.headers['X-Intake-Token'] = INTAKE_SECRET
+
+    def submit(text):
+        response = session.post(f"{base_url}/intake", json={'text': text, 'send_email': send}, timeout=120)
+        response.raise_for_status()
+        return response.json()
+    return submit
+
+
+def in_process_submitter(send):
+    from intake import submit as intake_submit
+
+    def submit(text):
+        return intake_submit(text, send=send)
+    return submit
+
+
+def run(submit, messages, total, concurrency):
+    def one(i):
+        start = time.perf_counter()
+        try:
+            outcome = submit(messages[i % len(messages)])['status']
+        except Exception as e:
+            outcome = f"error: {type(e).__name__}"
+        return outcome, (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--url', default=INTAKE_URL)
+    parser.add_argument('--in-process', action='store_true', help="call intake.submit directly instead of HTTP")
+    parser.add_argument('--corpus', default=CORPUS_FILE, help="JSONL file with a 'text' field per line")
+    parser.add_argument('--email', action='store_true', help="actually send approval emails")
+    args = parser.parse_args()
+
+    messages = load_messages(args.corpus)
+    submit = in_process_submitter(args.email) if args.in_process else http_submitter(args.url, args.email)
+    results, elapsed = run(submit, messages, args.requests, args.concurrency)
+
+    latencies = sorted(ms for _, ms in results)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    print(f"{len(results)} submissions, concurrency {args.concurrency}, "
+          f"{'in-process' if args.in_process else args.url}")
+    print(f"throughput {len(results) / elapsed:.1f} msg/s  p50 {statistics.median(latencies):.1f} ms  "
+          f"p95 {p95:.1f} ms  max {latencies[-1]:.1f} ms")
+    for outcome, count in Counter(outcome for outcome, _ in results).most_common():
+        print(f"  {outcome}: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Latency and accuracy benchmark for nlu.extract_slots.
+
+Compares the current pipeline (trimmed spaCy model, keyword-regex intent and
+priority) against the previous behaviour (full en_core_web_sm pipeline, substring
+intent rules, priority from a second parse), and counts where their slots and
+intents differ. Then measures batch throughput of nlu.extract_slots_batch (nlp.pipe)
+for each --n-process value.
+
+With --startup, instead measures what a fresh process pays: import time, the
+first (cold, model-loading) call and warm calls, in-process and through a running
+nlu_worker.
+
+With --accuracy, runs the labelled corpus (data/nlu_corpus.jsonl: "text" plus
+"expected" slots) and reports p50/p95 latency, msg/s and per-slot precision and
+recall. --save-baseline writes those scores; --baseline exits non-zero if any
+score falls below the saved one, so speed work can't quietly cost accuracy.
+
+    python bench_nlu.py [--corpus messages.jsonl] [--repeat 20] [--n-process 1 2 4]
+    python bench_nlu.py --startup
+    python bench_nlu.py --accuracy [--baseline nlu_baseline.json] [--show-errors]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import spacy
+
+import nlu
+import nlu_worker
+from nlu_cache import LRUCache
+
+CORPUS_FILE = os.path.join('data', 'nlu_corpus.jsonl')
+# Slots scored by --accuracy; priority counts "Air" (1) as the positive class
+SCORED_SLOTS = ['items', 'base_location', 'destination', 'manager_name', 'priority']
+
+SAMPLE_MESSAGES = [
+    "Request 5 radios and 20 batteries from HQ to Outpost Alpha. Manager: Col. Smith, Email: smith@army.mil",
+    "Request 3 medical kits and 2 radios from HQ to Outpost Bravo. This is urgent and needed ASAP.",
+    "Request 10 boxes of batteries and 5 tents from Main Base 2 to Outpost Charlie.",
+    "Request 4 laptops, 1 medkit, and 20 bottles of water from HQ to Outpost Delta. Please deliver immediately.",
+    "Please repair the generator at Outpost Bravo",
+    "Send 2 trucks of fuel to Forward Base Echo and inspect the radio tower at the same location",
+    "need 5 radios to Outpost Alpha",
+]
+
+
+def load_corpus(path):
+    with open(path, 'r') as f:
+        return [json.loads(line)['text'] for line in f if line.strip()]
+
+
+def load_labelled(path):
+    with open(path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row['text'], row['expected']) for row in rows if 'expected' in row]
+
+
+def _norm(value):
+    return ' '.join(str(value).split()).strip(' .,;:').casefold()
+
+
+def slot_values(slot, slots):
+    """The comparable values one slot contributes; an empty set when unset."""
+    value = slots.get(slot)
+    if slot == 'items':
+        return {(_norm(item.get('resource')), str(item.get('quantity'))) for item in value or []}
+    if slot == 'priority':
+        return {'air'} if value == 1 else set()
+    return {_norm(value)} if value else set()
+
+
+def score(results):
+    """results: [(expected, predicted), ...] -> {slot: {precision, recall, tp, fp, fn}}."""
+    scores = {}
+    for slot in SCORED_SLOTS:
+        tp = fp = fn = 0
+        for expected, predicted in results:
+            want, got = slot_values(slot, expected), slot_values(slot, predicted)
+            tp += len(want & got)
+            fp += len(got - want)
+            fn += len(want - got)
+        scores[slot] = {
+            'precision': tp / (tp + fp) if tp + fp else 1.0,
+            'recall': tp / (tp + fn) if tp + fn else 1.0,
+            'tp': tp, 'fp': fp, 'fn': fn,
+        }
+    return scores
+
+
+def regressions(scores, baseline, tolerance):
+    return [f"{slot} {metric} {scores[slot][metric]:.3f} < baseline {baseline[slot][metric]:.3f}"
+            for slot in SCORED_SLOTS if slot in baseline
+            for metric in ('precision', 'recall')
+            if scores[slot][metric] < baseline[slot][metric] - tolerance]
+
+
+def run_accuracy(args):
+    labelled = load_labelled(args.corpus or CORPUS_FILE)
+    texts = [text for text, _ in labelled]
+    nlu.slot_cache = LRUCache(0)
+    report('extract', time_per_message(nlu.extract_slots, texts, args.repeat))
+
+    results = [(expected, nlu.extract_slots(text)) for text, expected in labelled]
+    scores = score(results)
+    print(f"{'slot':<14} {'precision':>9} {'recall':>7}   tp  fp  fn   ({len(labelled)} messages)")
+    for slot, m in scores.items():
+        print(f"{slot:<14} {m['precision']:9.3f} {m['recall']:7.3f} {m['tp']:4d} {m['fp']:3d} {m['fn']:3d}")
+    if args.show_errors:
+        for (expected, predicted), text in zip(results, texts):
+            for slot in SCORED_SLOTS:
+                if slot_values(slot, expected) != slot_values(slot, predicted):
+                    print(f"  {slot}: expected {expected.get(slot)!r}, got {predicted.get(slot)!r}  <- {text}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(scores, f, indent=2)
+        print(f"baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            failed = regressions(scores, json.load(f), args.tolerance)
+        for line in failed:
+            print(f"REGRESSION: {line}")
+        return 1 if failed else 0
+    return 0
+
+
+# The keyword rules before keyword_matcher: substring tests, and a token scan of a
+# second parse for priority
+LEGACY_RESOURCE_KEYWORDS = ["deliver", "resource", "send", "supply", "equipment", "item", "laptop", "projector",
+                            "generator", "radio", "radios", "printer", "vehicle", "truck", "fuel", "medkit"]
+LEGACY_SERVICE_KEYWORDS = ["fix", "repair", "maintenance", "service", "inspect", "engineer", "quality"]
+LEGACY_AIR_TOKENS = {"urgent", "immediate", "critical", "medical", "medkit", "radio", "radios", "life-saving",
+                     "emergency", "satellite"}
+LEGACY_AIR_PHRASES = ["asap", "as soon as possible", "immediately", "priority air"]
+
+
+def legacy_classify_intent(text):
+    text_lower = text.lower()
+    if any(word in text_lower for word in LEGACY_RESOURCE_KEYWORDS):
+        return "resource"
+    if any(word in text_lower for word in LEGACY_SERVICE_KEYWORDS):
+        return "service"
+    return "resource"
+
+
+def legacy_priority(full_nlp, text):
+    if any(token.text in LEGACY_AIR_TOKENS for token in full_nlp(text.lower())):
+        return 1
+    return 1 if any(word in text.lower() for word in LEGACY_AIR_PHRASES) else 0
+
+
+def legacy_extract_slots(full_nlp, text):
+    """The pre-change pipeline: full model for slot extraction, then a second parse for the old priority rules."""
+    current = nlu.nlp
+    nlu.nlp = full_nlp
+    try:
+        slots = nlu.extract_slots(text)
+    finally:
+        nlu.nlp = current
+    slots['priority'] = legacy_priority(full_nlp, text)
+    return slots
+
+
+def time_per_message(fn, messages, repeat):
+    for text in messages:  # warm-up
+        fn(text)
+    samples = []
+    for _ in range(repeat):
+        for text in messages:
+            start = time.perf_counter()
+            fn(text)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<10} mean {statistics.mean(samples):7.3f} ms  p50 {statistics.median(samples):7.3f} ms  "
+          f"p95 {p95:7.3f} ms  ({1000 / statistics.mean(samples):.0f} msg/s)")
+
+
+def batch_throughput(messages, repeat, batch_size, n_process):
+    texts = messages * repeat
+    start = time.perf_counter()
+    count = sum(1 for _ in nlu.extract_slots_batch(texts, batch_size=batch_size, n_process=n_process))
+    return count / (time.perf_counter() - start)
+
+
+# Run in a fresh interpreter so import and model load are really cold
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module} as m
+imported = time.perf_counter()
+m.extract_slots(sys.argv[1])
+first = time.perf_counter()
+warm = []
+for _ in range(20):
+    t = time.perf_counter()
+    m.extract_slots(sys.argv[1])
+    warm.append(time.perf_counter() - t)
+warm.sort()
+print(json.dumps({{'import': imported - start, 'first': first - imported, 'warm': warm[len(warm) // 2]}}))
+"""
+
+
+def startup_latency(module, text):
+    out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT.format(module=module), text],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def report_startup(messages):
+    runs = [('in-process', 'nlu')]
+    if nlu_worker.worker_available():
+        runs.append(('worker', 'nlu_worker'))
+    else:
+        print(f"(no NLU worker on {nlu_worker.SOCKET_PATH}; start one with `python nlu_worker.py`)")
+    for label, module in runs:
+        t = startup_latency(module, messages[0])
+        print(f"{label:<10} import {t['import'] * 1000:7.1f} ms  first call {t['first'] * 1000:7.1f} ms  "
+              f"warm call {t['warm'] * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help="JSONL file with a 'text' field per line")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--n-process', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--startup', action='store_true', help="measure cold-start and warm latency only")
+    parser.add_argument('--accuracy', action='store_true',
+                        help=f"latency and per-slot precision/recall over a labelled corpus (default {CORPUS_FILE})")
+    parser.add_argument('--baseline', help="scores JSON to compare against (--accuracy)")
+    parser.add_argument('--save-baseline', help="write this run's scores to a JSON file (--accuracy)")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="allowed drop below the baseline")
+    parser.add_argument('--show-errors', action='store_true', help="print every slot that differs from its label")
+    args = parser.parse_args()
+    if args.accuracy:
+        sys.exit(run_accuracy(args))
+    messages = load_corpus(args.corpus) if args.corpus else SAMPLE_MESSAGES
+    if args.startup:
+        report_startup(messages)
+        return
+
+    start = time.perf_counter()
+    full_nlp = spacy.load(nlu.SPACY_MODEL)
+    full_load = time.perf_counter() - start
+    start = time.perf_counter()
+    nlu.nlp = nlu.load_nlp()
+    trimmed_load = time.perf_counter() - start
+    # Time the pipeline itself; the slot cache is measured separately below
+    cache, nlu.slot_cache = nlu.slot_cache, LRUCache(0)
+    print(f"pipes before: {full_nlp.pipe_names}")
+    print(f"pipes after:  {nlu.nlp.pipe_names}")
+    print(f"model load    before {full_load * 1000:.0f} ms, after {trimmed_load * 1000:.0f} ms")
+
+    mismatches = sum(legacy_extract_slots(full_nlp, text) != nlu.extract_slots(text) for text in messages)
+    print(f"slot mismatches between before/after: {mismatches} of {len(messages)}")
+    mismatches = sum(legacy_classify_intent(text) != nlu._intent_from_keywords(text) for text in messages)
+    print(f"intent mismatches between before/after: {mismatches} of {len(messages)}")
+
+    report('before', time_per_message(lambda text: legacy_extract_slots(full_nlp, text), messages, args.repeat))
+    report('after', time_per_message(nlu.extract_slots, messages, args.repeat))
+    report('intent old', time_per_message(legacy_classify_intent, messages, args.repeat))
+    report('intent new', time_per_message(nlu._intent_from_keywords, messages, args.repeat))
+    nlu.slot_cache = cache
+    report('cached', time_per_message(nlu.extract_slots, messages, args.repeat))
+    print(f"slot cache: {nlu.slot_cache.stats()}")
+
+    nlu.slot_cache = LRUCache(0)
+    batched = list(nlu.extract_slots_batch(messages, batch_size=args.batch_size))
+    mismatches = sum(slots != nlu.extract_slots(text) for text, slots in zip(messages, batched))
+    print(f"slot mismatches between single/batch: {mismatches} of {len(messages)}")
+    for n_process in args.n_process:
+        rate = batch_throughput(messages, args.repeat, args.batch_size, n_process)
+        print(f"batch      n_process={n_process:<2} {rate:8.0f} msg/s")
+
+
+if __name__ == '__main__':
+    main()
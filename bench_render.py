@@ -0,0 +1,73 @@
+"""
+Route map rendering benchmark: times draw_network plus encoding for the full-size
+PNG, the low-DPI email preview and SVG at several network sizes. The 15-unit case
+is the live generate_route network; larger ones come from supply_network.generate.
+
+    python bench_render.py [--sizes 15 500 5000] [--repeat 3]
+"""
+import argparse
+import io
+import statistics
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import generate_route
+import supply_network
+from route_images import ROUTE_IMAGE_DPI, ROUTE_PREVIEW_DPI
+
+PRIORITY = 1
+OUTPUTS = [('png', 'png', ROUTE_IMAGE_DPI), ('preview', 'png', ROUTE_PREVIEW_DPI), ('svg', 'svg', ROUTE_IMAGE_DPI)]
+
+
+def network_case(num_mobile):
+    """(coords, edges, num_main, dest, route table) for a network of num_mobile units."""
+    if num_mobile == generate_route.NUM_MOBILE:
+        dest_idx = 11
+        G, pos, *table = generate_route.build_supply_graph(dest_idx, PRIORITY)
+        coords = np.array([pos[i] for i in range(G.number_of_nodes())], dtype=float)
+        return coords, generate_route.undirected_edges(G), generate_route.NUM_MAIN, \
+            generate_route.NUM_MAIN + dest_idx, table
+    net = supply_network.generate(num_mobile)
+    dest = net.num_nodes - 1
+    return net.coords, net.links(), net.num_main, dest, list(net.route_table(dest, PRIORITY))
+
+
+def time_render(case, fmt, dpi, repeat):
+    coords, edges, num_main, dest, (paths, metrics, edge_mode, best_bal) = case
+    draw, encode, size = [], [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = generate_route.draw_network(coords, edges, num_main, dest, paths, metrics,
+                                          edge_mode, best_bal, PRIORITY)
+        drawn = time.perf_counter()
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
+        draw.append(drawn - start)
+        encode.append(time.perf_counter() - drawn)
+        size = buf.tell()
+    return statistics.median(draw), statistics.median(encode), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark route map rendering.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[15, 500, 5000], help="mobile units per network")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'units':>6} {'links':>6}  {'output':<8} {'draw ms':>8} {'encode ms':>10} {'KB':>8}")
+    for num_mobile in args.sizes:
+        case = network_case(num_mobile)
+        for name, fmt, dpi in OUTPUTS:
+            draw, encode, size = time_render(case, fmt, dpi, args.repeat)
+            print(f"{num_mobile:>6} {len(case[1]):>6}  {name:<8} {draw * 1000:>8.1f} {encode * 1000:>10.1f} {size / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,344 @@
+import copy
 import json
 import os
+import threading
+import time
 from datetime import datetime
 from uuid import uuid4
 
+from dotenv import load_dotenv
+
+import archive
+import journal_store
+import roster
+import sqlite_store
+import status_feed
+from file_utils import atomic_write_json, file_lock
+
+load_dotenv()
+
 DATA_DIR = 'data'
 RESOURCE_FILE = os.path.join(DATA_DIR, 'resource_requests.json')
 SERVICE_FILE = os.path.join(DATA_DIR, 'service_requests.json')
 DRIVERS_FILE = os.path.join(DATA_DIR, 'drivers.json')
+MANAGERS_FILE = os.path.join(DATA_DIR, 'managers.json')
+
+# 'journal' appends new/updated requests to a JSONL log next to the snapshot file;
+# 'json' rewrites the whole snapshot on every change;
+# 'sqlite' stores requests in an indexed SQLite database (see sqlite_store.py)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'journal')
 
 # Ensure data directory exists
 def ensure_data_dir():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-# Load all requests from file
-def load_requests(request_type):
-    ensure_data_dir()
-    file = RESOURCE_FILE if request_type == 'resource' else SERVICE_FILE
+def _request_file(request_type):
+    return RESOURCE_FILE if request_type == 'resource' else SERVICE_FILE
+
+# --- Read cache ---
+# Parsed request lists are kept per process together with a request_id -> position
+# index, and re-read only when the file's (inode, mtime, size) signature changes.
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+def _file_signature(file):
+    paths = [file, journal_store.journal_path(file)] if STORAGE_BACKEND == 'journal' else [file]
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def _store_cache(request_type, signature, requests, index=None):
+    if index is None:
+        index = {req.get('request_id'): i for i, req in enumerate(requests)}
+    entry = {'signature': signature, 'requests': requests, 'index': index}
+    with _cache_lock:
+        _cache[request_type] = entry
+    return entry
+
+def _read_json_list(file):
     if not os.path.exists(file):
-        with open(file, 'w') as f:
-            json.dump([], f)
+        return []
     with open(file, 'r') as f:
         return json.load(f)
 
+def _load_cached(request_type):
+    ensure_data_dir()
+    file = _request_file(request_type)
+    if not os.path.exists(file):
+        atomic_write_json(file, [])
+    # Stat before reading: if the file changes mid-read we just reload next time
+    signature = _file_signature(file)
+    with _cache_lock:
+        entry = _cache.get(request_type)
+        if entry is not None and entry['signature'] == signature:
+            _cache_stats['hits'] += 1
+            return entry
+        _cache_stats['misses'] += 1
+    if STORAGE_BACKEND == 'journal':
+        requests = journal_store.replay(file)
+    else:
+        requests = _read_json_list(file)
+    return _store_cache(request_type, signature, requests)
+
+def cache_stats():
+    """Return read-cache hit/miss counters for this process."""
+    with _cache_lock:
+        hits, misses = _cache_stats['hits'], _cache_stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+# Load all requests from file. The returned list is shared with the cache; treat it as read-only.
+def load_requests(request_type):
+    if STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.load_requests(request_type)
+    return _load_cached(request_type)['requests']
+
 # Save all requests to file
 def save_requests(request_type, requests):
+    if STORAGE_BACKEND == 'sqlite':
+        sqlite_store.save_requests(request_type, requests)
+        return
+    ensure_data_dir()
+    file = _request_file(request_type)
+    with file_lock(file):
+        _write_requests(file, requests)
+        _store_cache(request_type, _file_signature(file), list(requests))
+
+def _write_requests(file, requests):
+    if STORAGE_BACKEND == 'journal':
+        journal_store.compact(file, requests)
+    else:
+        atomic_write_json(file, requests)
+
+# Remove every request matching `predicate` from the live store, handing them to
+# `sink` first (under the same lock) so nothing is lost if the sink fails
+def extract_requests(request_type, predicate, sink):
+    if STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.extract_requests(request_type, predicate, sink)
     ensure_data_dir()
-    file = RESOURCE_FILE if request_type == 'resource' else SERVICE_FILE
-    with open(file, 'w') as f:
-        json.dump(requests, f, indent=2)
+    file = _request_file(request_type)
+    with file_lock(file):
+        requests = _load_cached(request_type)['requests']
+        moved = [req for req in requests if predicate(req)]
+        if moved:
+            sink(moved)
+            keep = [req for req in requests if not predicate(req)]
+            _write_requests(file, keep)
+            _store_cache(request_type, _file_signature(file), keep)
+    return moved
+
+# Move closed requests (rejected, or approved with a driver) into the monthly cold segments
+def archive_closed_requests(request_types=('resource', 'service')):
+    counts = {}
+    for request_type in request_types:
+        moved = extract_requests(request_type, archive.is_closed,
+                                 lambda reqs, t=request_type: archive.write_segments(t, reqs))
+        counts[request_type] = len(moved)
+    return counts
+
+# --- Group commit ---
+# Mutations on the JSON/journal backends are queued per request type. The first
+# writer to arrive leads a batch: if no batch of that type is being written it
+# commits at once, so a lone writer never waits. Otherwise writers arriving while
+# the current batch is written join the leader's, which then waits a further
+# GROUP_COMMIT_MS (default 0) for stragglers and applies the whole batch under
+# one file lock with a single journal append or file rewrite.
+GROUP_COMMIT_MS = float(os.getenv('GROUP_COMMIT_MS', 0))
+
+class _Mutation:
+    def __init__(self, apply):
+        self.apply = apply  # fn(requests, index) -> (result, list of journal entries)
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+_pending_mutations = {}
+_pending_lock = threading.Lock()
+# Held per request type while a batch is written
+_commit_locks = {}
+
+def _submit_mutation(request_type, apply):
+    mutation = _Mutation(apply)
+    with _pending_lock:
+        queue = _pending_mutations.setdefault(request_type, [])
+        queue.append(mutation)
+        is_leader = len(queue) == 1
+        commit_lock = _commit_locks.setdefault(request_type, threading.Lock())
+    if is_leader:
+        if not commit_lock.acquire(blocking=False):
+            # Another batch is being written; writers arriving meanwhile join this one
+            commit_lock.acquire()
+            if GROUP_COMMIT_MS:
+                time.sleep(GROUP_COMMIT_MS / 1000.0)
+        try:
+            with _pending_lock:
+                batch = _pending_mutations.pop(request_type)
+            _commit_batch(request_type, batch)
+        finally:
+            commit_lock.release()
+    mutation.done.wait()
+    if mutation.error is not None:
+        raise mutation.error
+    return mutation.result
+
+def _commit_batch(request_type, batch):
+    ensure_data_dir()
+    file = _request_file(request_type)
+    try:
+        with file_lock(file):
+            # Records are replaced, never mutated in place, so shallow copies keep the cache intact
+            cached = _load_cached(request_type)
+            requests = list(cached['requests'])
+            index = dict(cached['index'])
+            entries = []
+            for mutation in batch:
+                try:
+                    mutation.result, mutation_entries = mutation.apply(requests, index)
+                except Exception as e:
+                    mutation.error = e
+                    continue
+                entries.extend(mutation_entries)
+            if entries:
+                if STORAGE_BACKEND == 'journal':
+                    journal_store.append_entries(file, entries)
+                    if journal_store.needs_compaction(file):
+                        journal_store.compact(file, requests)
+                else:
+                    atomic_write_json(file, requests)
+                _store_cache(request_type, _file_signature(file), requests, index)
+    except Exception as e:
+        for mutation in batch:
+            if mutation.error is None:
+                mutation.error = e
+    finally:
+        for mutation in batch:
+            mutation.done.set()
 
 # Add a new request
 def add_request(request_type, request_data):
-    requests = load_requests(request_type)
-    requests.append(request_data)
-    save_requests(request_type, requests)
+    add_requests(request_type, [request_data])
+
+# Add many requests in a single commit
+def add_requests(request_type, requests_data):
+    if not requests_data:
+        return
+    if STORAGE_BACKEND == 'sqlite':
+        sqlite_store.add_requests(request_type, requests_data)
+        return
+    records = copy.deepcopy(list(requests_data))
+    def apply(requests, index):
+        for record in records:
+            index[record.get('request_id')] = len(requests)
+            requests.append(record)
+        return None, [{'op': 'add', 'record': record} for record in records]
+    _submit_mutation(request_type, apply)
 
 # Generate unique request ID
 def generate_request_id(request_type):
     prefix = 'R' if request_type == 'resource' else 'S'
     return f"{prefix}-{datetime.now().year}-{str(uuid4())[:8]}"
 
+# Build a new resource request record from extracted slots
+def build_resource_request(request_id, slots, managers, request_date):
+    return {
+        "request_id": request_id,
+        "items": slots.get('items', []),
+        "base_location": slots['base_location'],
+        "destination": slots['destination'],
+        "managers": managers,
+        "approved_by": None,
+        "delivery_person": {"name": None, "email": None},
+        "delivery_route": [],
+        "request_date": str(request_date),
+        "close_date": None,
+        "status": "Pending",
+        "priority": slots.get('priority', 0)
+    }
+
+# Build a new service request record from extracted slots
+def build_service_request(request_id, slots, managers, request_date):
+    return {
+        "request_id": request_id,
+        "services": slots.get('services', []),
+        "description": slots['description'],
+        "location": slots['location'],
+        "requester": slots['requester'],
+        "managers": managers,
+        "approved_by": None,
+        "quality_engineer": None,
+        "service_engineer": None,
+        "request_date": str(request_date),
+        "close_date": None,
+        "status": "Pending"
+    }
+
 # Find a request by ID
 def find_request_by_id(request_type, request_id):
-    requests = load_requests(request_type)
-    for req in requests:
-        if req.get('request_id') == request_id:
-            return req
-    return None
+    if STORAGE_BACKEND == 'sqlite':
+        found = sqlite_store.find_request_by_id(request_type, request_id)
+    else:
+        entry = _load_cached(request_type)
+        i = entry['index'].get(request_id)
+        found = copy.deepcopy(entry['requests'][i]) if i is not None else None
+    if found is None:
+        # Closed requests live in the cold archive (see archive.py)
+        found = archive.find_archived(request_type, request_id)
+    return found
+
+# Find requests whose status is one of `statuses`
+def find_requests_by_status(request_type, statuses):
+    if STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.find_requests_by_status(request_type, statuses)
+    return [copy.deepcopy(req) for req in load_requests(request_type) if req.get('status') in statuses]
+
+# Update a request by ID without telling status subscribers; returns (found, change),
+# where change is the new (status, assigned_driver) or None if neither changed
+def apply_request_update(request_type, request_id, update_fn):
+    changes = []
+    def tracked_update(req):
+        before = (req.get('status'), req.get('assigned_driver'))
+        updated = update_fn(req)
+        after = (updated.get('status'), updated.get('assigned_driver'))
+        changes[:] = [after] if after != before else []
+        return updated
+    if STORAGE_BACKEND == 'sqlite':
+        found = sqlite_store.update_request_by_id(request_type, request_id, tracked_update)
+    else:
+        def apply(requests, index):
+            i = index.get(request_id)
+            if i is None:
+                return False, []
+            # Work on a copy so a failing update_fn cannot leave a half-applied record in the batch
+            requests[i] = tracked_update(copy.deepcopy(requests[i]))
+            return True, [{'op': 'put', 'record': requests[i]}]
+        found = _submit_mutation(request_type, apply)
+    return found, (changes[0] if changes else None)
+
+# Let status subscribers (see status_feed.py) know about a change once it is durable
+def publish_status_change(request_type, request_id, change):
+    if change is not None:
+        status, assigned_driver = change
+        status_feed.publish(request_type, request_id, status, assigned_driver)
 
 # Update a request by ID
 def update_request_by_id(request_type, request_id, update_fn):
-    requests = load_requests(request_type)
-    for i, req in enumerate(requests):
-        if req.get('request_id') == request_id:
-            requests[i] = update_fn(req)
-            save_requests(request_type, requests)
-            return True
-    return False
+    found, change = apply_request_update(request_type, request_id, update_fn)
+    publish_status_change(request_type, request_id, change)
+    return found
 
 def load_managers():
-    with open(os.path.join(DATA_DIR, 'managers.json'), 'r') as f:
+    with open(MANAGERS_FILE, 'r') as f:
         return json.load(f)
 
 def load_drivers():
@@ -72,46 +350,42 @@ def load_drivers():
     with open(DRIVERS_FILE, 'r') as f:
         return json.load(f)
 
+_drivers_index = {'signature': None, 'by_email': {}}
+_drivers_index_lock = threading.Lock()
+
+def get_driver_by_email(email):
+    """Return the first driver with this email, using an index rebuilt only when drivers.json changes."""
+    ensure_data_dir()
+    try:
+        st = os.stat(DRIVERS_FILE)
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        signature = None
+    with _drivers_index_lock:
+        if signature != _drivers_index['signature']:
+            by_email = {}
+            for driver in load_drivers():
+                by_email.setdefault(driver.get('email'), driver)
+            _drivers_index['by_email'] = by_email
+            _drivers_index['signature'] = signature
+        driver = _drivers_index['by_email'].get(email)
+    return dict(driver) if driver else None
+
 def get_on_duty_drivers(now=None):
     """Return a list of drivers on duty at the current time."""
     if now is None:
         now = datetime.now()
-    drivers = load_drivers()
-    time_str = now.strftime('%H:%M')
-    on_duty = []
-    
-    for driver in drivers:
-        start = driver.get('shift_start', '00:00')
-        end = driver.get('shift_end', '23:59')
-        
-        if start < end:
-            # Same day shift
-            if start <= time_str < end:
-                on_duty.append(driver)
-        else:
-            # Overnight shift (e.g., 22:00 to 06:00)
-            if time_str >= start or time_str < end:
-                on_duty.append(driver)
-    
-    return on_duty
+    ensure_data_dir()
+    return roster.load_roster(DRIVERS_FILE).on_duty(now)
 
 def get_on_duty_managers(now=None):
     """Return a list of managers on duty at the current day/time."""
     if now is None:
         now = datetime.now()
-    managers = load_managers()
-    day = now.strftime('%a')  # e.g., 'Mon', 'Tue', ...
-    time_str = now.strftime('%H:%M')
-    on_duty = []
-    for m in managers:
-        for shift in m.get('shifts', []):
-            if shift['day'] == day:
-                start = shift['start']
-                end = shift['end']
-                if start < end:
-                    if start <= time_str < end:
-                        on_duty.append(m)
-                else:  # overnight shift
-                    if time_str >= start or time_str < end:
-                        on_duty.append(m)
-    return on_duty 
\ No newline at end of file
+    return roster.load_roster(MANAGERS_FILE).on_duty(now)
+
+def get_next_on_duty_managers(now=None):
+    """Return (shift_start_datetime, managers) for the next manager shift starting after `now`."""
+    if now is None:
+        now = datetime.now()
+    return roster.load_roster(MANAGERS_FILE).next_on_duty(now)
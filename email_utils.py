@@ -3,16 +3,12 @@ import smtplib
 from email.mime.image import MIMEImage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from uuid import uuid4
-
-import matplotlib
-import matplotlib.pyplot as plt
-
-matplotlib.use('Agg')  # Use non-interactive backend for server environments
 
 from dotenv import load_dotenv
 
-from generate_route import draw_supply_graph
+import route_images
+from gazetteer import destination_index
+from token_store import driver_tokens
 
 load_dotenv()
 
@@ -21,9 +17,11 @@ SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
 SMTP_USER = os.getenv('SMTP_USER')
 SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
 APPROVAL_BASE_URL = os.getenv('APPROVAL_BASE_URL', 'http://localhost:5000')
+# Attach the lighter preview rendering of route maps (see route_images) instead of the full-size PNG
+ROUTE_EMAIL_PREVIEW = os.getenv('ROUTE_EMAIL_PREVIEW', '0') == '1'
 
 
-def send_email(to_email, subject, html_body, plain_body=None):
+def _build_message(to_email, subject, html_body, plain_body=None):
     msg = MIMEMultipart('alternative')
     msg['From'] = SMTP_USER
     msg['To'] = to_email
@@ -32,13 +30,50 @@ def send_email(to_email, subject, html_body, plain_body=None):
     part2 = MIMEText(html_body, 'html')
     msg.attach(part1)
     msg.attach(part2)
+    return msg
+
+
+def send_email(to_email, subject, html_body, plain_body=None):
+    msg = _build_message(to_email, subject, html_body, plain_body)
     with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
         server.starttls()
         server.login(SMTP_USER, SMTP_PASSWORD)
         server.sendmail(SMTP_USER, to_email, msg.as_string())
 
 
+def send_emails(messages):
+    """
+    Send many (to_email, subject, html_body) messages over a single SMTP session.
+    Returns a list of (to_email, error) for the messages that failed; if the
+    server cannot be reached at all, every message is reported as failed.
+    """
+    failures = []
+    if not messages:
+        return failures
+    sent = 0
+    try:
+        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+            server.starttls()
+            server.login(SMTP_USER, SMTP_PASSWORD)
+            for to_email, subject, html_body in messages:
+                try:
+                    msg = _build_message(to_email, subject, html_body)
+                    server.sendmail(SMTP_USER, to_email, msg.as_string())
+                except (smtplib.SMTPException, OSError) as e:
+                    failures.append((to_email, e))
+                sent += 1
+    except (smtplib.SMTPException, OSError) as e:
+        # Connection refused, DNS failure, timeout or a dropped session: the rest are unsent
+        failures.extend((to_email, e) for to_email, _, _ in messages[sent:])
+    return failures
+
+
 def send_approval_email(request, token, request_type, to_email):
+    send_email(to_email, *build_approval_email(request, token, request_type, to_email))
+
+
+def build_approval_email(request, token, request_type, to_email):
+    """Return (subject, html_body) for a manager approval email."""
     subject = f"Approval Needed: {request.get('request_id')}"
     approve_url = f"{APPROVAL_BASE_URL}/approve?token={token}"
     reject_url = f"{APPROVAL_BASE_URL}/reject?token={token}"
@@ -92,7 +127,7 @@ def send_approval_email(request, token, request_type, to_email):
     <a href='{approve_url}' style='padding:10px 20px;background:green;color:white;text-decoration:none;'>Approve</a>
     <a href='{reject_url}' style='padding:10px 20px;background:red;color:white;text-decoration:none;margin-left:10px;'>Reject</a>
     """
-    send_email(to_email, subject, html_body)
+    return subject, html_body
 
 
 def send_notification_email(to_email, subject, message):
@@ -104,8 +139,12 @@ def send_driver_assignment_email(request, driver, request_type):
     """Send delivery assignment email to driver after manager approval."""
     subject = f"Delivery Assignment: {request.get('request_id')}"
     
-    # Generate unique acceptance token
-    accept_token = str(uuid4())
+    # Generate unique acceptance token, indexed by token for /accept_delivery
+    accept_token = driver_tokens.issue({
+        'type': request_type,
+        'id': request.get('request_id'),
+        'driver_email': driver['email'],
+    })
     
     # Store the acceptance token in the request for later verification
     if 'driver_tokens' not in request:
@@ -114,21 +153,18 @@ def send_driver_assignment_email(request, driver, request_type):
     
     accept_url = f"{APPROVAL_BASE_URL}/accept_delivery?token={accept_token}"
     
-    # Generate shortest path image for resource requests
-    route_image_path = None
+    # Route map for resource requests (rendered once per destination/priority, then cached)
+    route_image = None
     if request_type == 'resource':
         try:
             destination = request.get('destination', 'Forward Base Alpha')
-            mobile_idx = hash(destination) % 15
+            mobile_idx = destination_index(destination)
             # Use the priority from the request, default to 0 (Road)
             priority = request.get('priority', 0)
-            fig = draw_supply_graph(selected_mobile_idx=mobile_idx, priority=priority)
-            route_image_path = f"temp_route_{request.get('request_id')}.png"
-            fig.savefig(route_image_path, dpi=150, bbox_inches='tight')
-            plt.close(fig)
+            route_image = route_images.route_image(mobile_idx, priority, preview=ROUTE_EMAIL_PREVIEW)
         except Exception as e:
             print(f"Failed to generate route image: {e}")
-            route_image_path = None
+            route_image = None
     
     # Format request details for email
     if request_type == 'resource':
@@ -139,7 +175,7 @@ def send_driver_assignment_email(request, driver, request_type):
             items_html = f'<li><b>Resource:</b> {request.get("resource")} | <b>Quantity:</b> {request.get("quantity")}</li>'
         
         route_section = ""
-        if route_image_path:
+        if route_image:
             route_section = f"""
             <h3>Optimal Route</h3>
             <p>Below is the shortest path from main supply bases to your destination:</p>
@@ -197,19 +233,12 @@ def send_driver_assignment_email(request, driver, request_type):
     msg.attach(part1)
     
     # Add image attachment if available
-    if route_image_path and os.path.exists(route_image_path):
-        try:
-            with open(route_image_path, 'rb') as img_file:
-                img_data = img_file.read()
-                image = MIMEImage(img_data)
-                image.add_header('Content-ID', '<route_image>')
-                image.add_header('Content-Disposition', 'inline', filename='supply_route.png')
-                msg.attach(image)
-            
-            # Clean up temporary file
-            os.remove(route_image_path)
-        except Exception as e:
-            print(f"Failed to attach route image: {e}")
+    if route_image:
+        fmt, _ = route_images.image_format(ROUTE_EMAIL_PREVIEW)
+        image = MIMEImage(route_image, route_images.MIME_SUBTYPES[fmt])
+        image.add_header('Content-ID', '<route_image>')
+        image.add_header('Content-Disposition', 'inline', filename=f'supply_route.{fmt}')
+        msg.attach(image)
     
     # Send email
     with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
@@ -0,0 +1,222 @@
+"""
+Location gazetteer: named places ("HQ", "Outpost Alpha") to map coordinates and
+supply-graph nodes.
+
+    python gazetteer.py [--cases data/location_cases.jsonl]
+
+Names are looked up normalized (case, punctuation and spacing folded), then as a
+known name contained in the text, then by fuzzy match for typos. NLU slots often
+hold a whole phrase ("HQ to Outpost Alpha."), so a lookup takes a role: an
+origin resolves to the first place named (or the text before " to "), a
+destination to the last (or the text after it). Fuzzy
+matching compares only the distinguishing part of a name ("Alpha" in "Outpost
+Alpha"), needs a clear lead over the next location, and never applies to
+"Main Base N", so an unknown place is not silently taken for a similar real one. Coordinates
+snap to the nearest graph node through a grid index over generate_route's layout.
+Names the gazetteer does not know fall back to a CRC32 of the normalized name, so
+every process maps the same text to the same node (unlike hash(), which changes
+with PYTHONHASHSEED).
+"""
+import argparse
+import difflib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from generate_route import NUM_MAIN, NUM_MOBILE, base_network, config_key
+from nlu_cache import LRUCache
+from supply_network import GridIndex
+
+GAZETTEER_FILE = os.getenv('GAZETTEER_FILE', os.path.join('data', 'locations.json'))
+# Slot texts as stored on requests, with the place each should resolve to
+CASES_FILE = os.path.join('data', 'location_cases.jsonl')
+FUZZY_CUTOFF = 0.8
+# The best fuzzy candidate must beat the next location by this much
+FUZZY_MARGIN = 0.1
+# Words many names share; fuzzy matching ignores them apart from requiring the
+# candidate to have every one the query has
+GENERIC_WORDS = ('outpost', 'camp', 'base', 'forward', 'main', 'depot', 'supply')
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+MAIN_BASE_NAME = re.compile(r'main\s*(?:base)?\s*\d+')
+
+
+def normalize_name(name):
+    """Lookup key for a place name: lower case, punctuation dropped, whitespace collapsed."""
+    return ' '.join(_PUNCTUATION.sub(' ', (name or '').lower()).split())
+
+
+def _split_generic(key):
+    """(generic words, distinguishing part) of a normalized name; typos of generic words count as generic."""
+    generic, rest = set(), []
+    for token in key.split():
+        close = difflib.get_close_matches(token, GENERIC_WORDS, n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            generic.add(close[0])
+        else:
+            rest.append(token)
+    return generic, ' '.join(rest)
+
+
+class Gazetteer:
+    """
+    Named locations from [{'name', 'aliases', 'coords'}, ...]. lookup() returns a
+    {'name', 'coords'} dict (shared; treat as read-only) or None.
+    """
+
+    def __init__(self, locations):
+        self._by_key = {}
+        for loc in locations:
+            entry = {'name': loc['name'], 'coords': tuple(loc['coords'])}
+            for name in [loc['name'], *loc.get('aliases', [])]:
+                self._by_key[normalize_name(name)] = entry
+        keys = sorted(self._by_key, key=len, reverse=True)
+        self._fuzzy = [(*_split_generic(key), self._by_key[key]) for key in keys]
+        self._regex = re.compile(r'\b(' + '|'.join(re.escape(k) for k in keys) + r')\b') if keys else None
+
+    def lookup(self, name, role='destination'):
+        """Entry for `name`; role 'origin' takes the first place in the text, 'destination' the last."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        # Only the origin's or destination's side of "A to B" can name the place
+        first = role == 'origin'
+        parts = key.split(' to ')
+        key = parts[0] if first else parts[-1]
+        if key in self._by_key:
+            return self._by_key[key]
+        if self._regex is not None:
+            # Keys are tried longest first, so each match is the longest name at its position
+            found = [m.group(1) for m in self._regex.finditer(key)]
+            if found:
+                return self._by_key[found[0] if first else found[-1]]
+        return self._fuzzy_lookup(key)
+
+    def _fuzzy_lookup(self, key):
+        # Main bases are identified by number; an unknown number is an unknown place
+        if MAIN_BASE_NAME.fullmatch(key):
+            return None
+        generic, distinct = _split_generic(key)
+        if not distinct:
+            return None
+        best = {}  # location name -> (score, entry), best over its aliases
+        for names_generic, names_distinct, entry in self._fuzzy:
+            if not names_distinct or not generic <= names_generic:
+                continue
+            score = difflib.SequenceMatcher(None, distinct, names_distinct).ratio()
+            if score > best.get(entry['name'], (0.0,))[0]:
+                best[entry['name']] = (score, entry)
+        ranked = sorted(best.values(), key=lambda item: item[0], reverse=True)
+        if not ranked or ranked[0][0] < FUZZY_CUTOFF:
+            return None
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < FUZZY_MARGIN:
+            return None
+        return ranked[0][1]
+
+
+def load_gazetteer(path=GAZETTEER_FILE):
+    """Gazetteer from a JSON file {"locations": [...]}; empty when the file does not exist."""
+    if not os.path.exists(path):
+        return Gazetteer([])
+    with open(path, 'r') as f:
+        return Gazetteer(json.load(f).get('locations', []))
+
+
+places = load_gazetteer()
+_resolved = LRUCache(1024)
+
+# Grid indexes over the supply graph's node coordinates, per network configuration:
+# (all nodes, mobile units only)
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def resolve(name, role='destination'):
+    """The gazetteer entry for `name` ({'name', 'coords'}) in `role`, or None if it is unknown."""
+    key = (normalize_name(name), role)
+    hit = _resolved.get(key)
+    if hit is None:
+        # Cache misses too, as False, so unknown names skip the fuzzy search next time
+        hit = places.lookup(key[0], role) or False
+        _resolved.put(key, hit)
+    return hit or None
+
+
+def _node_indexes():
+    config = config_key()
+    with _index_lock:
+        indexes = _indexes.get(config)
+        if indexes is None:
+            _, pos, _ = base_network()
+            coords = np.array([pos[i] for i in range(len(pos))], dtype=float)
+            # About four nodes per cell over the layout's bounding box
+            extent = np.ptp(coords, axis=0).max() or 1.0
+            cell = extent / max(1.0, math.sqrt(len(coords) / 4))
+            indexes = _indexes[config] = (GridIndex(coords, cell), GridIndex(coords[NUM_MAIN:], cell))
+    return indexes
+
+
+def nearest_node(coords, mobile_only=False):
+    """Graph node closest to `coords`; with mobile_only, the closest mobile unit."""
+    all_nodes, mobile = _node_indexes()
+    if mobile_only:
+        found, _ = mobile.nearest(np.asarray(coords, dtype=float))
+        return NUM_MAIN + int(found[0])
+    found, _ = all_nodes.nearest(np.asarray(coords, dtype=float))
+    return int(found[0])
+
+
+def _fallback_node(name):
+    return NUM_MAIN + zlib.crc32(normalize_name(name).encode()) % NUM_MOBILE
+
+
+def location_node(name, role='destination'):
+    """
+    Graph node for a location name: a main base for HQ / "Main Base N", else the
+    nearest node. Pass role='origin' for a base_location slot.
+    """
+    place = resolve(name, role)
+    return nearest_node(place['coords']) if place else _fallback_node(name)
+
+
+def destination_index(name):
+    """Mobile unit index (0..NUM_MOBILE-1) a delivery to `name` is routed to, as draw_supply_graph takes it."""
+    place = resolve(name)
+    node = nearest_node(place['coords'], mobile_only=True) if place else _fallback_node(name)
+    return node - NUM_MAIN
+
+
+def check_cases(path=CASES_FILE):
+    """[(case, resolved name)] for every case in a JSONL file that does not resolve as expected."""
+    failures = []
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            place = places.lookup(case['text'], case.get('role', 'destination'))
+            name = place['name'] if place else None
+            if name != case['expected']:
+                failures.append((case, name))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that stored slot texts resolve to the expected places.")
+    parser.add_argument('--cases', default=CASES_FILE, help="JSONL with 'text', 'role' and 'expected' per line")
+    args = parser.parse_args()
+    failures = check_cases(args.cases)
+    for case, name in failures:
+        print(f"{case.get('role', 'destination'):<11} {case['text']!r}: expected {case['expected']}, got {name}")
+    print(f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,15 @@
+import hashlib
 import random
+import re
+import threading
 
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import networkx as nx
 import numpy as np
 
+import routing
+
 # Configuration constants
 SEED = 42
 NUM_MAIN = 3
@@ -16,19 +22,37 @@ AIR_COST_UNIT = 3.0
 MAIN_COORDS = np.array([[0, 0], [10, 0], [5, 8]])
 
 
-def build_supply_graph(selected_mobile_idx=11, priority=1):
+def config_key():
+    """Everything the generated network depends on apart from the destination."""
+    return (SEED, NUM_MAIN, NUM_MOBILE, MAX_NEIGHBORS, ROAD_SPEED, AIR_SPEED,
+            ROAD_COST_UNIT, AIR_COST_UNIT, MAIN_COORDS.tobytes())
+
+
+def graph_version():
+    """Short fingerprint of the configuration and the link edits applied on top of it."""
+    return hashlib.sha1(repr((config_key(), tuple(_edits))).encode()).hexdigest()[:12]
+
+
+def node_index(label):
+    """Graph node for a node id or a map label ("Main2", "Main 2", "M4")."""
+    if isinstance(label, (int, np.integer)):
+        return int(label)
+    match = re.fullmatch(r'\s*(main|m)\s*(\d+)\s*', str(label), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"unknown node label: {label!r}")
+    number = int(match.group(2))
+    if match.group(1).lower() == 'main' and 1 <= number <= NUM_MAIN:
+        return number - 1
+    if match.group(1).lower() == 'm' and 1 <= number <= NUM_MOBILE:
+        return NUM_MAIN + number - 1
+    raise ValueError(f"no such node: {label!r}")
+
+
+def _generate_network(dest_index):
     """
-    Builds and returns:
-      - G: the MultiDiGraph with road/air edges
-      - pos: node→(x,y) dict for plotting
-      - paths: dict main_index→list of node indices (composite-optimal)
-      - metrics: dict main_index→(t_road, c_road, t_air, c_air)
-      - edge_mode: dict main_index→list of (u, v, mode_sel)
-      - best_bal: index of the main with lowest composite sum
+    Seeded network for one destination (mains never link straight to it), or for
+    none when dest_index is None. Returns (G, pos, collapsed).
     """
-    if not (0 <= selected_mobile_idx < NUM_MOBILE):
-        raise ValueError(f"selected_mobile_idx must be between 0 and {NUM_MOBILE-1}, got {selected_mobile_idx}")
-    
     random.seed(SEED)
     np.random.seed(SEED)
 
@@ -36,7 +60,6 @@ def build_supply_graph(selected_mobile_idx=11, priority=1):
     mobile_coords = np.random.rand(NUM_MOBILE, 2) * 20
     coords = np.vstack([MAIN_COORDS, mobile_coords])
 
-    dest_index = NUM_MAIN + selected_mobile_idx
     main_indices = list(range(NUM_MAIN))
     mobile_indices = list(range(NUM_MAIN, total_nodes))
 
@@ -79,93 +102,267 @@ def build_supply_graph(selected_mobile_idx=11, priority=1):
         for j in random.sample(possible, min(extras, len(possible))):
             add_edge(i, j, G)
 
-    paths, comp_sums, metrics, edge_mode = {}, {}, {}, {}
-    for m in main_indices:
-        H = G.copy()
-        for om in main_indices:
-            if om != m: H.remove_node(om)
-        try:
-            path = nx.dijkstra_path(H, source=m, target=dest_index, weight='comp')
-        except nx.NetworkXNoPath:
-            path = []
-        paths[m] = path
-        
-        if path:
-            comp_sums[m] = sum(min(e['comp'] for e in G[u][v].values()) for u,v in zip(path, path[1:]))
-            t_r = c_r = t_a = c_a = 0.0
-            modes = []
-            for u,v in zip(path, path[1:]):
-                er = min((e for e in G[u][v].values() if e['mode']=='road'), key=lambda e: e['cost'])
-                ea = min((e for e in G[u][v].values() if e['mode']=='air'), key=lambda e: e['time'])
-                t_r += er['time']; c_r += er['cost']
-                t_a += ea['time']; c_a += ea['cost']
-                sel = 'A' if priority == 1 else 'R'
-                modes.append((u, v, sel))
-            metrics[m] = (t_r, c_r, t_a, c_a)
-            edge_mode[m] = modes
-        else:
-            comp_sums[m] = float('inf')
-            metrics[m] = (0.0, 0.0, 0.0, 0.0)
-            edge_mode[m] = []
-    
-    if all(comp == float('inf') for comp in comp_sums.values()):
-        best_bal = main_indices[0]
-    else:
-        best_bal = min(comp_sums, key=lambda m: comp_sums[m])
     pos = {i: tuple(coords[i]) for i in range(total_nodes)}
-    return G, pos, paths, metrics, edge_mode, best_bal
+    return G, pos, routing.collapse(G)
 
 
-def draw_supply_graph(selected_mobile_idx=11, priority=1):
+# The network is deterministic for a given configuration and destination, so it is
+# generated once per process: networks per (config, dest), shortest-path trees per
+# (config, dest), route tables per (config, dest, priority). Generation reseeds the
+# global RNGs, hence the lock.
+_networks = {}
+_trees = {}
+_routes = {}
+_cache_lock = threading.Lock()
+# Link edits (op, u, v, mode, time, cost) in the order they were made; cached networks
+# are edited in place and networks generated later replay the log
+_edits = []
+
+
+def build_supply_graph(selected_mobile_idx=11, priority=1):
     """
-    Builds the supply graph, draws it, and returns the Matplotlib Figure object.
+    Builds and returns:
+      - G: the MultiDiGraph with road/air edges
+      - pos: node→(x,y) dict for plotting
+      - paths: dict main_index→list of node indices (composite-optimal)
+      - metrics: dict main_index→(t_road, c_road, t_air, c_air)
+      - edge_mode: dict main_index→list of (u, v, mode_sel)
+      - best_bal: index of the main with lowest composite sum
+    Results are memoized and shared between callers; treat them as read-only.
     """
     if not (0 <= selected_mobile_idx < NUM_MOBILE):
         raise ValueError(f"selected_mobile_idx must be between 0 and {NUM_MOBILE-1}, got {selected_mobile_idx}")
-    
-    G, pos, paths, metrics, edge_mode, best_bal = build_supply_graph(selected_mobile_idx, priority)
+    dest_index = NUM_MAIN + selected_mobile_idx
+    config = config_key()
+    G, pos, collapsed = _network(dest_index)
+    with _cache_lock:
+        route = _routes.get((config, dest_index, priority))
+        if route is None:
+            dist, next_hop, _ = _tree(config, dest_index, collapsed)
+            route = _routes[(config, dest_index, priority)] = routing.route_table(
+                collapsed, dest_index, list(range(NUM_MAIN)), priority, tree=(dist, next_hop))
+    paths, metrics, edge_mode, best_bal = route
+    return G, pos, paths, metrics, edge_mode, best_bal
+
+
+def route_version(selected_mobile_idx):
+    """
+    Graph version the destination's routes were last computed at. It only changes
+    when an edit affects this destination's shortest-path tree, so results that
+    depend on the routes alone survive edits elsewhere in the graph. Anything that
+    shows the whole network (route images) must key on graph_version instead.
+    """
+    dest_index = NUM_MAIN + selected_mobile_idx
+    config = config_key()
+    _, _, collapsed = _network(dest_index)
+    with _cache_lock:
+        return _tree(config, dest_index, collapsed)[2]
+
+
+def _tree(config, dest_index, collapsed):
+    # Caller holds _cache_lock
+    tree = _trees.get((config, dest_index))
+    if tree is None:
+        dist, next_hop = routing.shortest_path_tree(collapsed, dest_index, terminals=range(NUM_MAIN))
+        tree = _trees[(config, dest_index)] = (dist, next_hop, graph_version())
+    return tree
+
+
+def _network(dest_index):
+    key = (config_key(), dest_index)
+    with _cache_lock:
+        network = _networks.get(key)
+        if network is None:
+            network = _generate_network(dest_index)
+            if _edits:
+                G, pos, _ = network
+                for edit in _edits:
+                    _apply_edit(G, dest_index, edit)
+                network = (G, pos, routing.collapse(G))
+            _networks[key] = network
+    return network
+
+
+def base_network():
+    """
+    (G, pos, collapsed) for the same seeded layout with no destination carved out:
+    mains may link to any mobile unit. Used for planning multi-stop runs, where
+    every stop is a destination. Shared; treat as read-only.
+    """
+    return _network(None)
+
+
+def _apply_edit(G, dest_index, edit):
+    """Apply one link edit to G in both directions. Returns whether G changed."""
+    op, u, v, mode, time, cost = edit
+    if op == 'add':
+        # Keep the generator's rules: mains never link to each other or to the destination
+        if (u < NUM_MAIN and v < NUM_MAIN) or (u < NUM_MAIN and v == dest_index) or \
+           (v < NUM_MAIN and u == dest_index):
+            return False
+    changed = False
+    for a, b in ((u, v), (v, u)):
+        for key, e in list((G.get_edge_data(a, b) or {}).items()):
+            if mode is not None and e['mode'] != mode:
+                continue
+            if op == 'update':
+                e['time'] = e['time'] if time is None else time
+                e['cost'] = e['cost'] if cost is None else cost
+                e['comp'] = e['time'] + e['cost']
+            else:
+                G.remove_edge(a, b, key)
+            changed = True
+        if op == 'add':
+            G.add_edge(a, b, mode=mode, time=time, cost=cost, comp=time + cost)
+            changed = True
+    return changed
+
+
+def _tree_affected(tree, collapsed, dest_index, u, v):
+    """
+    Whether a change to the link u-v can change the destination's shortest-path
+    tree: the link is a tree edge, or it now offers a node a shorter way to the
+    destination. Mains other than the destination are never expanded, so links
+    into them cannot shorten anything.
+    """
+    dist, next_hop, _ = tree
+    for a, b in ((u, v), (v, u)):
+        if next_hop.get(a) == b:
+            return True
+        w = collapsed.pred[b].get(a)
+        if w is not None and b in dist and (b == dest_index or b >= NUM_MAIN) and \
+                dist[b] + w < dist.get(a, float('inf')):
+            return True
+    return False
+
+
+def _edit_link(op, u, v, mode=None, time=None, cost=None):
+    """
+    Record a link edit and apply it to every cached network. Route tables whose
+    shortest-path tree is affected are dropped (recomputed on next use); all
+    others are kept. Returns the mobile unit indices whose routes were invalidated.
+    """
+    u, v = node_index(u), node_index(v)
+    edit = (op, u, v, mode, time, cost)
+    config = config_key()
+    stale = []
+    with _cache_lock:
+        _edits.append(edit)
+        for (cfg, dest_index), (G, _, collapsed) in _networks.items():
+            if cfg != config or not _apply_edit(G, dest_index, edit):
+                continue
+            collapsed.refresh(G, u, v)
+            collapsed.refresh(G, v, u)
+            tree = _trees.get((cfg, dest_index))
+            if tree is not None and _tree_affected(tree, collapsed, dest_index, u, v):
+                stale.append(dest_index)
+        for dest_index in stale:
+            del _trees[(config, dest_index)]
+            for priority in [k[2] for k in _routes if k[:2] == (config, dest_index)]:
+                del _routes[(config, dest_index, priority)]
+    return sorted(dest_index - NUM_MAIN for dest_index in stale)
+
+
+def update_link(u, v, mode, time=None, cost=None):
+    """Change the time and/or cost of the road or air link between u and v (node ids or "M4"-style labels)."""
+    return _edit_link('update', u, v, mode, time, cost)
+
+
+def remove_link(u, v, mode=None):
+    """Close the link between u and v: just its road or air edges, or both when mode is None."""
+    return _edit_link('remove', u, v, mode)
+
+
+def add_link(u, v, road=None, air=None):
+    """
+    Open (or replace) a link between u and v. road/air are (time, cost); a mode left
+    as None gets the nominal values for the distance (speed and unit cost, no noise).
+    """
+    u, v = node_index(u), node_index(v)
+    _, pos, _ = base_network()
+    dist = float(np.linalg.norm(np.subtract(pos[u], pos[v])))
+    road = road or (dist / ROAD_SPEED, dist * ROAD_COST_UNIT)
+    air = air or (dist / AIR_SPEED, dist * AIR_COST_UNIT)
+    stale = _edit_link('add', u, v, 'road', *road)
+    return sorted(set(stale) | set(_edit_link('add', u, v, 'air', *air)))
+
+
+def prewarm(priorities=(0, 1)):
+    """Build every destination's network and route tables up front (e.g. at server start)."""
+    for idx in range(NUM_MOBILE):
+        for priority in priorities:
+            build_supply_graph(idx, priority)
+
+
+def undirected_edges(G):
+    """Each linked node pair once, as a (k, 2) array (the graph has 4 edges per link)."""
+    pairs = {(u, v) if u < v else (v, u) for u, v in G.edges()}
+    return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def draw_network(coords, edges, num_main, dest, paths, metrics, edge_mode, best_bal, priority, label_limit=200):
+    """
+    Draw a supply network and its routes; returns the Figure.
+    coords is an (n, 2) array (mains first), edges a (k, 2) array of undirected links and
+    the route arguments are a route table as returned by build_supply_graph. Every group
+    of lines is one LineCollection and every node class one scatter, so the cost is a
+    handful of artists regardless of network size. Only mains and the destination are
+    labelled once the network has more than label_limit nodes.
+    """
+    coords = np.asarray(coords, dtype=float)
+    total_nodes = len(coords)
     fig, ax = plt.subplots(figsize=(12,10))
 
-    # Draw all edges
-    for u, v in G.edges():
-        x0,y0 = pos[u]; x1,y1 = pos[v]
-        ax.plot([x0,x1],[y0,y1], color='lightgrey', linewidth=1, alpha=0.4)
-    # Draw nodes
-    total_nodes = G.number_of_nodes()
-    mobile_indices = list(range(NUM_MAIN, total_nodes))
-    main_indices = list(range(NUM_MAIN))
-    dest = NUM_MAIN + selected_mobile_idx
-    nx.draw_networkx_nodes(G, pos, nodelist=mobile_indices, node_size=200, node_color='lightgrey')
-    nx.draw_networkx_nodes(G, pos, nodelist=main_indices, node_size=500, node_color='white', edgecolors='black')
-    nx.draw_networkx_nodes(G, pos, nodelist=[dest], node_size=600, node_color='yellow')
+    # All links, drawn once each (alpha matches the four overlapping 0.4 strokes per link drawn before)
+    ax.add_collection(LineCollection(coords[edges], colors='lightgrey', linewidths=1, alpha=0.85, zorder=1))
+    # Nodes; marker area shrinks on large networks so they stay distinguishable
+    scale = min(1.0, 200 / total_nodes)
+    ax.scatter(coords[num_main:, 0], coords[num_main:, 1], s=200 * scale, c='lightgrey', zorder=2)
+    ax.scatter(coords[:num_main, 0], coords[:num_main, 1], s=500, c='white', edgecolors='black', zorder=3)
+    ax.scatter([coords[dest, 0]], [coords[dest, 1]], s=600, c='yellow', zorder=3)
     # Labels
-    node_names = [f"Main{i+1}" for i in range(NUM_MAIN)] + [f"M{i+1}" for i in range(total_nodes-NUM_MAIN)]
-    labels = {i: node_names[i] for i in range(total_nodes)}
-    nx.draw_networkx_labels(G, pos, labels=labels, font_size=8)
+    labelled = range(total_nodes) if total_nodes <= label_limit else [*range(num_main), dest]
+    for i in labelled:
+        name = f"Main{i+1}" if i < num_main else f"M{i-num_main+1}"
+        ax.text(coords[i, 0], coords[i, 1], name, fontsize=8, ha='center', va='center', zorder=5)
     # Path drawing
     colors = ['red','green','blue']
+    main_indices = list(range(num_main))
     for idx, m in enumerate(main_indices):
-        path = paths[m]; col = colors[idx]
-        for u,v in zip(path, path[1:]):
-            x0,y0 = pos[u]; x1,y1 = pos[v]
-            ax.plot([x0,x1],[y0,y1], color=col, linewidth=3)
+        path = paths[m]
+        if len(path) > 1:
+            segments = np.stack([coords[path[:-1]], coords[path[1:]]], axis=1)
+            ax.add_collection(LineCollection(segments, colors=colors[idx % len(colors)], linewidths=3, zorder=4))
     # Highlight best path
     best_path = paths[best_bal]
-    for u,v in zip(best_path, best_path[1:]):
-        x0,y0 = pos[u]; x1,y1 = pos[v]
-        ax.plot([x0,x1],[y0,y1], color='black', linewidth=4, linestyle='--')
+    if len(best_path) > 1:
+        segments = np.stack([coords[best_path[:-1]], coords[best_path[1:]]], axis=1)
+        ax.add_collection(LineCollection(segments, colors='black', linewidths=4, linestyles='--', zorder=4))
     # Edge mode labels on best path
     for u,v,sel in edge_mode[best_bal]:
-        x0,y0 = pos[u]; x1,y1 = pos[v]
-        xm,ym = (x0+x1)/2, (y0+y1)/2
-        ax.text(xm, ym, sel, color='black', fontsize=14, fontweight='bold', ha='center', va='center')
+        xm,ym = (coords[u] + coords[v]) / 2
+        ax.text(xm, ym, sel, color='black', fontsize=14, fontweight='bold', ha='center', va='center', zorder=5)
     # Metrics annotation
     for idx, m in enumerate(main_indices):
         t_r,c_r,t_a,c_a = metrics[m]
         ax.text(0.02, 0.95-idx*0.04,
                 f"Main{m+1} - Road: T={t_r:.1f}, C={c_r:.1f} | Air: T={t_a:.1f}, C={c_a:.1f}",
-                transform=ax.transAxes, color=colors[idx], fontsize=12, fontweight='bold', va='top')
+                transform=ax.transAxes, color=colors[idx % len(colors)], fontsize=12, fontweight='bold', va='top')
     ax.set_title(f"Supply Graph (Priority={'Air' if priority==1 else 'Road'})", fontsize=16)
+    ax.autoscale_view()
     ax.axis('off')
     fig.tight_layout()
     return fig
+
+
+def draw_supply_graph(selected_mobile_idx=11, priority=1):
+    """
+    Builds the supply graph, draws it, and returns the Matplotlib Figure object.
+    """
+    if not (0 <= selected_mobile_idx < NUM_MOBILE):
+        raise ValueError(f"selected_mobile_idx must be between 0 and {NUM_MOBILE-1}, got {selected_mobile_idx}")
+    
+    G, pos, paths, metrics, edge_mode, best_bal = build_supply_graph(selected_mobile_idx, priority)
+    coords = np.array([pos[i] for i in range(G.number_of_nodes())], dtype=float)
+    return draw_network(coords, undirected_edges(G), NUM_MAIN, NUM_MAIN + selected_mobile_idx,
+                        paths, metrics, edge_mode, best_bal, priority)
@@ -0,0 +1,134 @@
+"""
+Bulk request ingestion.
+
+Reads a JSONL stream where each line is either free text ({"text": "..."}, or
+"title"/"body" fields) or a structured request ({"items": [...], "base_location": ...}
+or {"services": [...], "location": ...}), extracts slots with nlu, and creates the
+requests in batches through intake.create_requests: one storage write per request
+type, one approval-token write and one SMTP session per batch.
+
+    python ingest.py requests.jsonl --batch-size 200 --progress-every 1000
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import date
+
+from data_utils import get_on_duty_managers
+from intake import build_records, create_requests, missing_slots
+from nlu import classify_intent_batch
+from nlu_worker import extract_slots_batch
+
+SLOT_DEFAULTS = {
+    "items": [], "services": [], "base_location": None, "destination": None,
+    "description": None, "location": None, "requester": None, "priority": 0,
+}
+
+
+def request_text(entry):
+    if entry.get('text'):
+        return entry['text']
+    parts = [entry.get(key) for key in ('title', 'body') if entry.get(key)]
+    return '. '.join(parts) or None
+
+
+def entries_slots(entries, n_process=1):
+    """Return [(intent, slots), ...] for JSONL entries, running free text through batched NLU."""
+    results = [None] * len(entries)
+    free_text = []
+    for i, entry in enumerate(entries):
+        text = request_text(entry)
+        if text and not (entry.get('items') or entry.get('services')):
+            free_text.append((i, text))
+            continue
+        slots = dict(SLOT_DEFAULTS, **entry)
+        if not slots['description']:
+            slots['description'] = text
+        results[i] = ('resource' if slots['items'] else 'service'), slots
+    texts = [text for _, text in free_text]
+    intents = classify_intent_batch(texts)
+    for (i, _), intent, slots in zip(free_text, intents, extract_slots_batch(texts, n_process)):
+        results[i] = intent, slots
+    return results
+
+
+def ingest_batch(entries, managers, request_date, send=True, n_process=1):
+    """Create the requests for one batch of entries. Returns a stats dict."""
+    stats = {'created': 0, 'skipped': 0, 'email_failures': 0}
+    records = []
+    for intent, slots in entries_slots(entries, n_process):
+        if missing_slots(intent, slots):
+            stats['skipped'] += 1
+            continue
+        records.extend(build_records(slots, managers, request_date))
+    stats['email_failures'] = create_requests(records, managers, send)
+    stats['created'] = len(records)
+    return stats
+
+
+def read_entries(stream):
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            print(f"line {line_no}: invalid JSON, skipped", file=sys.stderr)
+
+
+def ingest(stream, batch_size=100, progress_every=1000, send=True, request_date=None, n_process=1,
+           out=sys.stderr):
+    request_date = request_date or date.today().isoformat()
+    managers = [{"name": m["name"], "email": m["email"]} for m in get_on_duty_managers()]
+    totals = {'processed': 0, 'created': 0, 'skipped': 0, 'email_failures': 0}
+    started = time.perf_counter()
+    next_report = progress_every
+    batch = []
+
+    def flush():
+        stats = ingest_batch(batch, managers, request_date, send, n_process)
+        for key, value in stats.items():
+            totals[key] += value
+        totals['processed'] += len(batch)
+        batch.clear()
+
+    for entry in read_entries(stream):
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            flush()
+            if progress_every and totals['processed'] >= next_report:
+                elapsed = time.perf_counter() - started
+                print(f"{totals['processed']} processed, {totals['created']} created, "
+                      f"{totals['skipped']} skipped, {totals['processed'] / elapsed:.1f} msg/s", file=out)
+                next_report += progress_every
+    if batch:
+        flush()
+    totals['seconds'] = time.perf_counter() - started
+    totals['msg_per_sec'] = totals['processed'] / totals['seconds'] if totals['seconds'] else 0.0
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create requests from a JSONL file.")
+    parser.add_argument('path', help="JSONL file, or - for stdin")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--progress-every', type=int, default=1000,
+                        help="print throughput every N processed lines (0 disables)")
+    parser.add_argument('--no-email', action='store_true', help="create requests and tokens without emailing managers")
+    parser.add_argument('--request-date', help="request_date for created requests (default: today)")
+    parser.add_argument('--n-process', type=int, default=1, help="spaCy worker processes for slot extraction")
+    args = parser.parse_args()
+
+    stream = sys.stdin if args.path == '-' else open(args.path, 'r')
+    with stream:
+        totals = ingest(stream, args.batch_size, args.progress_every, not args.no_email, args.request_date,
+                        args.n_process)
+    print(f"Done: {totals['processed']} processed, {totals['created']} created, {totals['skipped']} skipped, "
+          f"{totals['email_failures']} email failures in {totals['seconds']:.2f}s "
+          f"({totals['msg_per_sec']:.1f} msg/s)")
+
+
+if __name__ == '__main__':
+    main()
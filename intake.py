@@ -0,0 +1,152 @@
+"""
+Request intake: turns one chat message into stored requests, approval tokens and
+manager emails. Used in-process by ingest.py and by the approval server's /intake
+endpoint; the Streamlit app goes through submit_remote() and falls back to
+submit() when the server is down.
+"""
+import os
+import re
+from datetime import date
+
+import requests
+
+from data_utils import (add_requests, build_resource_request,
+                        build_service_request, generate_request_id,
+                        get_next_on_duty_managers, get_on_duty_managers)
+from email_utils import build_approval_email, send_emails
+from nlu import classify_intent
+from nlu_worker import extract_slots
+from token_store import approval_tokens
+
+# Shared secret for the approval server's /intake endpoint, sent as the X-Intake-Token
+# header. Without it the endpoint only accepts requests from localhost.
+INTAKE_SECRET = os.getenv('INTAKE_SECRET')
+# Where the chat UI reaches /intake. Separate from APPROVAL_BASE_URL, the public
+# address put in emails, since the UI usually runs next to the server.
+INTAKE_URL = os.getenv('INTAKE_URL', 'http://localhost:5000')
+
+
+def extract_direct_slots(text, slots):
+    # Look for patterns like "field: value"
+    for field in slots.keys():
+        match = re.search(rf"{field}:\s*([^\n,]+)", text, re.IGNORECASE)
+        if match:
+            slots[field] = match.group(1).strip()
+    return slots
+
+
+def missing_slots(intent, slots):
+    """What still has to be asked for before a request of this intent can be created."""
+    missing = []
+    if intent == "resource":
+        if not slots.get("items"):
+            missing.append("resource, quantity, destination")
+        else:
+            if not slots.get("base_location"):
+                missing.append("base location")
+            if not slots.get("destination"):
+                missing.append("destination")
+    elif intent == "service":
+        if not slots.get("services"):
+            missing.append("service action(s) and target(s)")
+        if not slots.get("location"):
+            missing.append("location")
+    return missing
+
+
+def build_records(slots, managers, request_date):
+    """Return [(request_type, record), ...]: both for hybrid messages, otherwise one."""
+    records = []
+    if slots.get('items'):
+        records.append(('resource', build_resource_request(
+            generate_request_id('resource'), slots, managers, request_date)))
+    if slots.get('services') or not slots.get('items'):
+        records.append(('service', build_service_request(
+            generate_request_id('service'), slots, managers, request_date)))
+    return records
+
+
+def create_requests(records, managers, send=True):
+    """
+    Store records ([(request_type, record), ...]), issue one approval token per
+    record and manager, and email the managers over one SMTP session.
+    Returns the number of emails that failed.
+    """
+    by_type = {}
+    for request_type, record in records:
+        by_type.setdefault(request_type, []).append(record)
+    for request_type, reqs in by_type.items():
+        add_requests(request_type, reqs)
+
+    pending = [(request_type, record, m) for request_type, record in records for m in managers]
+    tokens = approval_tokens.issue_many([
+        {'type': request_type, 'id': record['request_id'], 'manager_email': m['email'], 'manager_name': m['name']}
+        for request_type, record, m in pending
+    ])
+    if not send:
+        return 0
+    messages = [(m['email'], *build_approval_email(record, token, request_type, m['email']))
+                for (request_type, record, m), token in zip(pending, tokens)]
+    return len(send_emails(messages))
+
+
+def submit(text, request_date=None, send=True):
+    """
+    Run one message through NLU and, if nothing is missing, create its request(s).
+    Returns a JSON-serialisable dict:
+      status: 'created' or 'incomplete' ('error' only from submit_remote)
+      intent, missing: the classified intent and the slots still needed
+      requests: [{'type', 'request_id'}, ...] that were created
+      next_on_duty: {'start', 'managers'} when no manager is on duty now, else None
+      email_failures: number of approval emails that could not be sent
+    """
+    intent = classify_intent(text)
+    slots = extract_direct_slots(text, extract_slots(text))
+    result = {'status': 'incomplete', 'intent': intent, 'missing': missing_slots(intent, slots),
+              'requests': [], 'next_on_duty': None, 'email_failures': 0}
+    if result['missing']:
+        return result
+
+    on_duty = get_on_duty_managers()
+    if not on_duty:
+        next_start, next_managers = get_next_on_duty_managers()
+        result['next_on_duty'] = {
+            'start': next_start.isoformat() if next_start else None,
+            'managers': [m['name'] for m in next_managers],
+        }
+    managers = [{"name": m["name"], "email": m["email"]} for m in on_duty]
+    records = build_records(slots, managers, request_date or date.today().isoformat())
+    result['email_failures'] = create_requests(records, managers, send)
+    result['status'] = 'created'
+    result['requests'] = [{'type': request_type, 'request_id': record['request_id']}
+                          for request_type, record in records]
+    return result
+
+
+def submit_remote(base_url, text, request_date=None, timeout=30):
+    """
+    Client side of the approval server's /intake endpoint. Returns submit()'s
+    dict, or None if nothing was created: the server could not be reached or
+    refused the call (4xx, e.g. a missing or wrong INTAKE_SECRET), so the caller may
+    submit in-process. A timeout or a server error returns
+    {'status': 'error', 'error': ...}: the request may already exist, so it must
+    not be submitted again automatically.
+    """
+    payload = {'text': text}
+    if request_date:
+        payload['request_date'] = request_date
+    headers = {'X-Intake-Token': INTAKE_SECRET} if INTAKE_SECRET else {}
+    try:
+        response = requests.post(f"{base_url}/intake", json=payload, headers=headers, timeout=timeout)
+        if 400 <= response.status_code < 500:
+            # Refused before intake ran
+            print(f"Intake server at {base_url} refused the request ({response.status_code}); nothing was created")
+            return None
+        response.raise_for_status()
+        return response.json()
+    except requests.ConnectionError:
+        # Includes connect timeouts: the message never reached the server
+        return None
+    except (requests.RequestException, ValueError) as e:
+        return {'status': 'error', 'error': str(e), 'intent': None, 'missing': [],
+                'requests': [], 'next_on_duty': None, 'email_failures': 0}
@@ -0,0 +1,80 @@
+import json
+import os
+
+from file_utils import atomic_write_json
+
+# The journal is folded into the snapshot once it is larger than both this many
+# bytes and the snapshot itself, so total rewrite I/O stays linear in the data
+JOURNAL_COMPACT_MIN_BYTES = int(os.getenv('JOURNAL_COMPACT_MIN_BYTES', 64 * 1024))
+
+
+def journal_path(snapshot_file):
+    """Return the JSONL journal that sits next to a snapshot file."""
+    base, _ = os.path.splitext(snapshot_file)
+    return base + '.journal.jsonl'
+
+
+def _read_snapshot(snapshot_file):
+    if not os.path.exists(snapshot_file):
+        return []
+    with open(snapshot_file, 'r') as f:
+        return json.load(f)
+
+
+def replay(snapshot_file):
+    """
+    Rebuild the current list of requests from the snapshot plus its journal.
+    """
+    requests = _read_snapshot(snapshot_file)
+    path = journal_path(snapshot_file)
+    if not os.path.exists(path):
+        return requests
+    index = {req.get('request_id'): i for i, req in enumerate(requests)}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A torn line from a crashed writer; skip it and keep the rest
+                continue
+            record = entry.get('record')
+            # 'add' and 'put' both upsert so a journal replayed over a snapshot
+            # that already contains it (crash mid-compaction) stays idempotent
+            i = index.get(record.get('request_id'))
+            if i is None:
+                index[record.get('request_id')] = len(requests)
+                requests.append(record)
+            else:
+                requests[i] = record
+    return requests
+
+
+def append_entries(snapshot_file, entries):
+    """Append journal entries ({'op': 'add'|'put', 'record': {...}}) in one write."""
+    if not entries:
+        return
+    data = ''.join(json.dumps(entry) + '\n' for entry in entries)
+    with open(journal_path(snapshot_file), 'a') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def compact(snapshot_file, requests):
+    """Write a fresh snapshot of all requests and truncate the journal."""
+    atomic_write_json(snapshot_file, requests)
+    path = journal_path(snapshot_file)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def needs_compaction(snapshot_file):
+    path = journal_path(snapshot_file)
+    if not os.path.exists(path):
+        return False
+    journal_size = os.path.getsize(path)
+    snapshot_size = os.path.getsize(snapshot_file) if os.path.exists(snapshot_file) else 0
+    return journal_size > max(JOURNAL_COMPACT_MIN_BYTES, snapshot_size)
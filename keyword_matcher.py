@@ -0,0 +1,71 @@
+import json
+import os
+import re
+
+KEYWORDS_FILE = os.path.join('data', 'nlu_keywords.json')
+
+
+class KeywordMatcher:
+    """
+    One compiled word-boundary regex over every keyword in `tables`
+    ({category: [keyword, ...]}). A keyword may be a phrase; it matches with any
+    whitespace between its words, and optionally followed by one of `suffixes`
+    ("radio" also matches "radios"). A keyword ending in "e" drops it before a
+    suffix starting with a vowel ("service" matches "serviced" and "servicing").
+    Matching is case-insensitive and never hits inside a longer word ("fix" does
+    not match "prefix").
+    """
+
+    def __init__(self, tables, suffixes=()):
+        self._categories = {}
+        for category, keywords in tables.items():
+            for keyword in keywords:
+                self._categories.setdefault(self._key(keyword), set()).add(category)
+        # Keyword with its final "e" dropped -> keyword
+        vowel_suffixes = [s for s in suffixes if s[:1] in 'aeiou']
+        self._stems = {kw[:-1]: kw for kw in self._categories if kw.endswith('e')} if vowel_suffixes else {}
+        # Longest first so a phrase wins over a keyword it starts with
+        alternatives = sorted(self._categories, key=len, reverse=True)
+        pattern = rf"({self._alternation(alternatives)})"
+        if suffixes:
+            pattern += rf"(?:{self._alternation(suffixes)})?"
+        if self._stems:
+            pattern += rf"|({self._alternation(self._stems)})(?:{self._alternation(vowel_suffixes)})"
+        self._regex = re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE) if alternatives else None
+
+    @staticmethod
+    def _alternation(words):
+        """Regex alternation of `words`, longest first, with any whitespace between a phrase's words."""
+        return '|'.join(r'\s+'.join(re.escape(part) for part in word.split())
+                        for word in sorted(words, key=len, reverse=True))
+
+    @staticmethod
+    def _key(keyword):
+        return ' '.join(keyword.lower().split())
+
+    def categories(self, text):
+        """Every category with at least one keyword in `text`, in one pass."""
+        found = set()
+        if self._regex is None or not text:
+            return found
+        for match in self._regex.finditer(text):
+            if match.group(1) is not None:
+                keyword = self._key(match.group(1))
+            else:
+                keyword = self._stems[self._key(match.group(2))]
+            found |= self._categories[keyword]
+        return found
+
+
+def load_matcher(path=KEYWORDS_FILE, default=None):
+    """
+    Build a KeywordMatcher from a JSON file of the form
+    {"suffixes": [...], "categories": {name: [keyword, ...]}}.
+    Falls back to `default` (same shape) when the file does not exist.
+    """
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config = json.load(f)
+    else:
+        config = default or {}
+    return KeywordMatcher(config.get('categories', {}), config.get('suffixes', ()))
@@ -1,13 +1,71 @@
+import itertools
+import os
 import re
-from typing import Any, Dict
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List
 
-import spacy
+from keyword_matcher import load_matcher
+from nlu_cache import LRUCache, normalize_text
 
-# Load spaCy English model
-nlp = spacy.load('en_core_web_sm')
+SPACY_MODEL = 'en_core_web_sm'
+# Slot extraction only reads doc.ents and token text, so the tagger, parser,
+# attribute ruler and lemmatizer are never loaded
+UNUSED_PIPES = ['tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'senter']
 
-RESOURCE_KEYWORDS = ["deliver", "resource", "send", "supply", "equipment", "item", "laptop", "projector", "generator", "radio", "radios", "printer", "vehicle", "truck", "fuel", "medkit"]
-SERVICE_KEYWORDS = ["fix", "repair", "maintenance", "service", "inspect", "engineer", "quality"]
+
+def load_nlp(model=SPACY_MODEL):
+    """Load the spaCy pipeline with only the components slot extraction uses."""
+    import spacy  # deferred: importing spacy alone takes most of a second
+
+    pipeline = spacy.load(model, exclude=UNUSED_PIPES)
+    # The shared tok2vec only feeds the excluded components; NER has its own embedding layer
+    if 'tok2vec' in pipeline.pipe_names and not pipeline.get_pipe('tok2vec').listening_components:
+        pipeline.disable_pipe('tok2vec')
+    return pipeline
+
+
+# spaCy English model, loaded on first use so importing this module stays cheap
+nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    global nlp
+    if nlp is None:
+        with _nlp_lock:
+            if nlp is None:
+                nlp = load_nlp()
+    return nlp
+
+
+# Results for recently seen messages. Slots are keyed on the exact text, since the slot
+# regexes and NER see its case and line breaks; intents on normalize_text(casefold=True),
+# as keyword matching ignores both. Set NLU_CACHE_FILE
+# (e.g. data/nlu_cache.json) to keep slot results across restarts.
+NLU_CACHE_SIZE = int(os.getenv('NLU_CACHE_SIZE', 1024))
+NLU_CACHE_FILE = os.getenv('NLU_CACHE_FILE')
+# Bump when the slot rules change so a persisted cache from older code is dropped
+NLU_CACHE_VERSION = 4
+slot_cache = LRUCache(NLU_CACHE_SIZE, NLU_CACHE_FILE, version=f"{SPACY_MODEL}/{NLU_CACHE_VERSION}")
+intent_cache = LRUCache(NLU_CACHE_SIZE)
+
+
+def cache_stats():
+    return {'slots': slot_cache.stats(), 'intent': intent_cache.stats()}
+
+
+# Keyword tables live in data/nlu_keywords.json so they can grow without code changes;
+# these are used when that file is missing. "air_priority" words make a request go by air.
+DEFAULT_KEYWORDS = {
+    "suffixes": ["s", "es", "ed", "ing", "ion", "y"],
+    "categories": {
+        "resource": ["deliver", "deliveries", "resource", "send", "supply", "supplies", "equipment", "item", "laptop", "projector", "generator", "radio", "printer", "vehicle", "truck", "fuel", "medkit"],
+        "service": ["fix", "repair", "maintenance", "service", "inspect", "engineer", "quality"],
+        "air_priority": ["urgent", "immediate", "immediately", "critical", "medical", "medkit", "radio", "life-saving", "emergency", "satellite", "asap", "as soon as possible", "priority air"],
+    },
+}
+keywords = load_matcher(default=DEFAULT_KEYWORDS)
 
 RESOURCE_REGEX = re.compile(r"(?:need|request|send|deliver|supply|provide)\s+(\d+)\s+([\w\- ]+)", re.IGNORECASE)
 MULTI_ITEM_REGEX = re.compile(r"(\d+)\s+([\w\- ]+)", re.IGNORECASE)
@@ -19,10 +77,19 @@ SERVICE_ITEM_REGEX = re.compile(r"(repair|fix|inspect|service|maintain|clean|ins
 
 def classify_intent(text: str) -> str:
     """Classify intent as 'resource' or 'service' based on keywords."""
-    text_lower = text.lower()
-    if any(word in text_lower for word in RESOURCE_KEYWORDS):
+    key = normalize_text(text, casefold=True)
+    intent = intent_cache.get(key)
+    if intent is None:
+        intent = _intent_from_keywords(text)
+        intent_cache.put(key, intent)
+    return intent
+
+
+def _intent_from_keywords(text: str) -> str:
+    found = keywords.categories(text)
+    if "resource" in found:
         return "resource"
-    if any(word in text_lower for word in SERVICE_KEYWORDS):
+    if "service" in found:
         return "service"
     # Default fallback (could use LLM or zero-shot here)
     return "resource"
@@ -47,22 +114,70 @@ def extract_service_items(text: str):
 
 
 def ai_priority_from_text(request_text: str) -> int:
-    """AI-based priority extraction using spaCy and rules. Returns 1 for Air, 0 for Road."""
-    doc = nlp(request_text.lower())
-    # High-priority keywords
-    high_priority_keywords = {"urgent", "immediate", "critical", "medical", "medkit", "radio", "radios", "life-saving", "emergency", "satellite"}
-    for token in doc:
-        if token.text in high_priority_keywords:
-            return 1  # Air
-    # Also check for explicit urgency in the text
-    if any(word in request_text.lower() for word in ["asap", "as soon as possible", "immediately", "priority air"]):
-        return 1
-    return 0  # Road
+    """Rule-based priority extraction. Returns 1 for Air, 0 for Road."""
+    return 1 if "air_priority" in keywords.categories(request_text) else 0
 
 
 def extract_slots(text: str) -> Dict[str, Any]:
     """Extract entities/slots from user text using spaCy NER."""
-    doc = nlp(text)
+    slots = slot_cache.get(text)
+    if slots is None:
+        slots = slots_from_doc(text, get_nlp()(text))
+        slot_cache.put(text, slots)
+    return slots
+
+
+def extract_slots_batch(texts: Iterable[str], batch_size: int = 256, n_process: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Stream texts through nlp.pipe and yield one slot dict per text, in input order.
+    With n_process > 1 spaCy parses in worker processes; the slot rules run here.
+    Cached texts are not parsed again. Input is read lazily and every result is
+    yielded as soon as it and those before it are ready, so memory stays at about
+    one parse batch however long the input is.
+    """
+    texts = iter(texts)
+    # (text, cached slots or None) read but not yet yielded; misses are parsed in this order
+    pending = deque()
+
+    def misses():
+        for text in texts:
+            slots = slot_cache.get(text)
+            pending.append((text, slots))
+            if slots is None:
+                yield text
+
+    def ready():
+        while pending and pending[0][1] is not None:
+            yield pending.popleft()[1]
+
+    # Cached texts ahead of the first miss need no model at all
+    for text in texts:
+        slots = slot_cache.get(text)
+        if slots is None:
+            pending.append((text, None))
+            break
+        yield slots
+    if not pending:
+        return
+    docs = get_nlp().pipe(itertools.chain([pending[0][0]], misses()), batch_size=batch_size, n_process=n_process)
+    for doc in docs:
+        # The pipe may have read cached texts ahead of this doc's message
+        yield from ready()
+        text, _ = pending.popleft()
+        slots = slots_from_doc(doc.text, doc)
+        slot_cache.put(text, slots)
+        yield slots
+        yield from ready()
+    yield from ready()
+
+
+def classify_intent_batch(texts: Iterable[str]) -> List[str]:
+    """classify_intent for many texts (keyword rules only, no parsing needed)."""
+    return [classify_intent(text) for text in texts]
+
+
+def slots_from_doc(text: str, doc) -> Dict[str, Any]:
+    """Slot extraction for a text whose spaCy Doc is already parsed."""
     slots = {
         "items": [],
         "services": [],
@@ -0,0 +1,99 @@
+import atexit
+import copy
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from file_utils import atomic_write_json
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text, casefold=False):
+    """
+    Cache key for a message: whitespace collapsed, and case folded with `casefold`.
+    Only for results that ignore both, such as the keyword intent; slot extraction
+    sees case and line breaks, so slot results are keyed on the exact text.
+    """
+    key = _WHITESPACE.sub(' ', text or '').strip()
+    return key.casefold() if casefold else key
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU map with hit/miss counters. Values are deep-copied
+    in and out so callers can mutate what they get back. With a path, entries are
+    loaded from it on creation and written back (atomically) at interpreter exit;
+    a file written under a different `version` is ignored.
+    """
+
+    def __init__(self, maxsize, path=None, version=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return  # a damaged cache file is just a cold cache
+        if saved.get('version') != self.version:
+            return
+        for key, value in saved.get('entries', []):
+            self._entries[key] = value
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [[key, value] for key, value in self._entries.items()]
+        atomic_write_json(self.path, {'version': self.version, 'entries': entries}, indent=None)
@@ -0,0 +1,133 @@
+"""
+Long-lived NLU worker. Keeps the spaCy model loaded and serves slot extraction
+over a Unix socket, so the Streamlit app and batch tools don't each pay the model
+load on startup.
+
+    python nlu_worker.py [--socket data/nlu.sock]
+
+Protocol: one JSON object per line, e.g. {"op": "extract_slots", "text": "..."},
+answered with {"result": ...} or {"error": "..."}. The client functions below
+fall back to running nlu in-process when no worker is listening, and always on
+platforms without Unix sockets (Windows).
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import nlu
+
+SOCKET_PATH = os.getenv('NLU_SOCKET', os.path.join('data', 'nlu.sock'))
+# Generous enough for a large extract_slots_batch call
+CLIENT_TIMEOUT = float(os.getenv('NLU_WORKER_TIMEOUT', 30))
+# Windows has no UnixStreamServer; the worker is unavailable there and clients stay in-process
+UNIX_SOCKETS = hasattr(socket, 'AF_UNIX') and hasattr(socketserver, 'UnixStreamServer')
+
+# spaCy pipelines are not documented as thread-safe; requests are parsed one at a time
+_nlp_lock = threading.Lock()
+
+
+def _handle(request):
+    op = request.get('op')
+    if op == 'extract_slots':
+        with _nlp_lock:
+            return nlu.extract_slots(request['text'])
+    if op == 'extract_slots_batch':
+        with _nlp_lock:
+            return list(nlu.extract_slots_batch(request['texts']))
+    if op == 'classify_intent':
+        return nlu.classify_intent(request['text'])
+    if op == 'cache_stats':
+        return nlu.cache_stats()
+    if op == 'ping':
+        return 'pong'
+    raise ValueError(f"unknown op {op!r}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {'result': _handle(json.loads(line))}
+            except Exception as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode())
+            self.wfile.flush()
+
+
+if UNIX_SOCKETS:
+    class NLUWorker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def serve(path=SOCKET_PATH):
+    if not UNIX_SOCKETS:
+        raise SystemExit("The NLU worker needs Unix sockets, which this platform does not support.")
+    start = time.perf_counter()
+    nlu.get_nlp()
+    print(f"NLU model loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+    if os.path.exists(path):
+        os.remove(path)  # stale socket from a previous run
+    with NLUWorker(path, _Handler) as server:
+        print(f"NLU worker listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+def call(op, path=SOCKET_PATH, timeout=CLIENT_TIMEOUT, **params):
+    """Send one request to the worker. Raises OSError if no worker is reachable."""
+    if not UNIX_SOCKETS:
+        raise ConnectionError("Unix sockets are not supported on this platform")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(dict(params, op=op)) + '\n').encode())
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("NLU worker closed the connection")
+    response = json.loads(line)
+    if 'error' in response:
+        raise RuntimeError(f"NLU worker: {response['error']}")
+    return response['result']
+
+
+def worker_available(path=SOCKET_PATH):
+    if not UNIX_SOCKETS or not os.path.exists(path):
+        return False
+    try:
+        return call('ping', path, timeout=1) == 'pong'
+    except OSError:
+        return False
+
+
+def extract_slots(text):
+    """nlu.extract_slots via the worker when it's running, otherwise in-process."""
+    if UNIX_SOCKETS and os.path.exists(SOCKET_PATH):
+        try:
+            return call('extract_slots', text=text)
+        except OSError:
+            pass
+    return nlu.extract_slots(text)
+
+
+def extract_slots_batch(texts, n_process=1):
+    """List form of nlu.extract_slots_batch, via the worker when it's running."""
+    texts = list(texts)
+    if UNIX_SOCKETS and os.path.exists(SOCKET_PATH):
+        try:
+            return call('extract_slots_batch', texts=texts)
+        except OSError:
+            pass
+    return list(nlu.extract_slots_batch(texts, n_process=n_process))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve nlu slot extraction over a Unix socket.")
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    serve(parser.parse_args().socket)
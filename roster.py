@@ -0,0 +1,122 @@
+import bisect
+import json
+import os
+import threading
+from datetime import timedelta
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def minute_of_week(dt):
+    return dt.weekday() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def _shift_intervals(person):
+    """
+    Yield (start, end) minute-of-week intervals for a manager (`shifts` with days)
+    or a driver (daily `shift_start`/`shift_end`). Overnight shifts (end <= start)
+    run into the next day; `end` may exceed MINUTES_PER_WEEK and wraps around.
+    """
+    if 'shifts' in person:
+        shifts = [(DAYS.index(s['day']), s['start'], s['end']) for s in person.get('shifts', [])]
+    else:
+        start = person.get('shift_start', '00:00')
+        end = person.get('shift_end', '23:59')
+        shifts = [(day, start, end) for day in range(7)]
+    for day, start, end in shifts:
+        start_min, end_min = _minutes(start), _minutes(end)
+        if end_min <= start_min:
+            end_min += MINUTES_PER_DAY
+        base = day * MINUTES_PER_DAY
+        yield base + start_min, base + end_min
+
+
+class Roster:
+    """
+    Duty roster precompiled into a minute-of-week table. `slots[m]` is the tuple of
+    people (indices into `people`, in file order) on duty during minute m, so
+    on_duty() is a single list lookup. Identical tuples are shared between minutes.
+    """
+
+    def __init__(self, people):
+        self.people = people
+        delta = [0] * (MINUTES_PER_WEEK + 1)
+        events = [[] for _ in range(MINUTES_PER_WEEK + 1)]
+        starts = {}
+        for i, person in enumerate(people):
+            for start, end in _shift_intervals(person):
+                # Split intervals that wrap past Sunday midnight
+                pieces = [(start, min(end, MINUTES_PER_WEEK))]
+                if end > MINUTES_PER_WEEK:
+                    pieces.append((0, end - MINUTES_PER_WEEK))
+                for lo, hi in pieces:
+                    events[lo].append((i, 1))
+                    events[hi].append((i, -1))
+                starts.setdefault(start % MINUTES_PER_WEEK, set()).add(i)
+        counts = [0] * len(people)
+        interned = {}
+        self.slots = []
+        current = ()
+        for minute in range(MINUTES_PER_WEEK):
+            if events[minute]:
+                for i, change in events[minute]:
+                    counts[i] += change
+                key = tuple(i for i, count in enumerate(counts) if count > 0)
+                current = interned.setdefault(key, key)
+            self.slots.append(current)
+        self.start_minutes = sorted(starts)
+        self.starts_at = {minute: sorted(indices) for minute, indices in starts.items()}
+
+    def on_duty(self, now):
+        """People on duty at datetime `now`, in file order."""
+        return [self.people[i] for i in self.slots[minute_of_week(now)]]
+
+    def next_on_duty(self, now):
+        """
+        Return (start_datetime, people) for the next shift start strictly after `now`
+        (minute resolution), or (None, []) if the roster has no shifts.
+        """
+        if not self.start_minutes:
+            return None, []
+        current = minute_of_week(now)
+        pos = bisect.bisect_right(self.start_minutes, current)
+        if pos < len(self.start_minutes):
+            minute = self.start_minutes[pos]
+            ahead = minute - current
+        else:
+            minute = self.start_minutes[0]
+            ahead = minute + MINUTES_PER_WEEK - current
+        start = now.replace(second=0, microsecond=0) + timedelta(minutes=ahead)
+        return start, [self.people[i] for i in self.starts_at[minute]]
+
+
+_rosters = {}
+_rosters_lock = threading.Lock()
+
+
+def load_roster(path):
+    """Return the Roster for a JSON people file, rebuilt only when the file changes."""
+    try:
+        st = os.stat(path)
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        signature = None
+    with _rosters_lock:
+        cached = _rosters.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+    people = []
+    if signature is not None:
+        with open(path, 'r') as f:
+            people = json.load(f)
+    roster = Roster(people)
+    with _rosters_lock:
+        _rosters[path] = (signature, roster)
+    return roster
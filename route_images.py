@@ -0,0 +1,82 @@
+"""
+Route map rendering for driver emails.
+
+Each (destination node, priority, graph version, format) is rendered once: image
+bytes are rendered in memory, kept in a bounded LRU, and optionally written to
+ROUTE_IMAGE_CACHE_DIR so other processes and restarts reuse them. The map draws
+every link, so the key uses generate_route.graph_version, which changes with the
+configuration and with every link edit; a map never shows a closed link or
+misses a new one.
+"""
+import io
+import os
+import threading
+
+import matplotlib
+
+matplotlib.use('Agg')  # Use non-interactive backend for server environments
+
+import matplotlib.pyplot as plt
+
+from file_utils import atomic_write_bytes
+from generate_route import NUM_MAIN, draw_supply_graph, graph_version
+from nlu_cache import LRUCache
+
+ROUTE_IMAGE_DPI = 150
+# Email preview: a lighter rendering (lower DPI, or SVG) for inline email images
+ROUTE_PREVIEW_DPI = int(os.getenv('ROUTE_PREVIEW_DPI', 72))
+ROUTE_PREVIEW_FORMAT = os.getenv('ROUTE_PREVIEW_FORMAT', 'png')  # 'png' or 'svg'
+ROUTE_IMAGE_CACHE_SIZE = int(os.getenv('ROUTE_IMAGE_CACHE_SIZE', 64))
+ROUTE_IMAGE_CACHE_DIR = os.getenv('ROUTE_IMAGE_CACHE_DIR')  # e.g. data/route_images; unset = memory only
+
+MIME_SUBTYPES = {'png': 'png', 'svg': 'svg+xml'}
+
+images = LRUCache(ROUTE_IMAGE_CACHE_SIZE)
+# pyplot keeps global state, so figures are drawn one at a time
+_render_lock = threading.RLock()
+
+
+def render_image(selected_mobile_idx, priority, fmt='png', dpi=ROUTE_IMAGE_DPI):
+    """Draw the route map and return it as image bytes (no temp files)."""
+    with _render_lock:
+        fig = draw_supply_graph(selected_mobile_idx=selected_mobile_idx, priority=priority)
+        try:
+            buf = io.BytesIO()
+            fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+        finally:
+            plt.close(fig)
+    return buf.getvalue()
+
+
+def image_format(preview=False):
+    """(format, dpi) for a full-size map or an email preview."""
+    return (ROUTE_PREVIEW_FORMAT, ROUTE_PREVIEW_DPI) if preview else ('png', ROUTE_IMAGE_DPI)
+
+
+def _disk_path(key):
+    dest, priority, version, fmt, dpi = key
+    return os.path.join(ROUTE_IMAGE_CACHE_DIR, f"{version}-{dest}-{priority}-{dpi}.{fmt}")
+
+
+def route_image(selected_mobile_idx, priority, preview=False):
+    """Bytes of the route map in image_format(preview), from memory, then disk, rendering only on a miss."""
+    fmt, dpi = image_format(preview)
+    key = (NUM_MAIN + selected_mobile_idx, priority, graph_version(), fmt, dpi)
+    image = images.get(key)
+    if image is not None:
+        return image
+    with _render_lock:
+        # Another thread may have rendered it while we waited for the lock
+        image = images.get(key)
+        if image is not None:
+            return image
+        if ROUTE_IMAGE_CACHE_DIR and os.path.exists(_disk_path(key)):
+            with open(_disk_path(key), 'rb') as f:
+                image = f.read()
+        else:
+            image = render_image(selected_mobile_idx, priority, fmt, dpi)
+            if ROUTE_IMAGE_CACHE_DIR:
+                os.makedirs(ROUTE_IMAGE_CACHE_DIR, exist_ok=True)
+                atomic_write_bytes(_disk_path(key), image)
+        images.put(key, image)
+    return image
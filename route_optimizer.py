@@ -1,10 +1,269 @@
-def compute_delivery_route(base_location, destination, waypoints=None):
+"""
+Multi-stop delivery planning with OR-Tools.
+
+plan_deliveries() takes approved resource requests that have no driver yet and the
+on-duty drivers, and builds consolidated runs: each request is a pickup at its base
+(a main supply base) and a delivery at its destination, so one driver can carry
+several requests in one trip. Travel times are road shortest paths over the supply
+graph (generate_route.base_network). Driver positions are not tracked, so a run
+starts at its first pickup and ends at its last delivery. Runs respect vehicle capacity (total item
+quantity), per-request delivery deadlines (tighter for Air-priority requests), a
+maximum run length and a solve-time budget. Requests that cannot be fitted are
+returned as unassigned rather than failing the plan; requests whose base and
+destination resolve to the same graph node have nothing to route and are
+returned as skipped.
+
+    python route_optimizer.py [--save]
+"""
+import argparse
+import os
+
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+import routing
+from data_utils import (find_requests_by_status, get_on_duty_drivers,
+                        update_request_by_id)
+from gazetteer import location_node
+from generate_route import NUM_MAIN, base_network
+
+VEHICLE_CAPACITY = int(os.getenv('VEHICLE_CAPACITY', 100))
+# Limits are in the supply graph's time units (road time, as in the route metrics)
+ROUTE_HORIZON = float(os.getenv('ROUTE_HORIZON', 300))
+URGENT_DEADLINE = float(os.getenv('URGENT_DEADLINE', 60))
+SOLVE_SECONDS = float(os.getenv('ROUTE_SOLVE_SECONDS', 5))
+# OR-Tools works in integers
+TIME_SCALE = 100
+# Dropping a request costs more than any feasible detour, so requests are only left
+# out when no run can take them
+DROP_PENALTY = int(ROUTE_HORIZON * TIME_SCALE * 10)
+
+
+def node_name(node):
+    """Node label as drawn on the route map: Main1.. for bases, M1.. for mobile units."""
+    return f"Main{node + 1}" if node < NUM_MAIN else f"M{node - NUM_MAIN + 1}"
+
+
+def travel_times(nodes, weight='road_time'):
+    """{(a, b): shortest travel time} between every pair of graph nodes in `nodes`."""
+    _, _, collapsed = base_network()
+    times = {}
+    for b in set(nodes):
+        dist, _ = routing.shortest_path_tree(collapsed, b, weight=weight)
+        for a in set(nodes):
+            times[(a, b)] = dist.get(a, float('inf'))
+    return times
+
+
+def request_demand(request):
+    return sum(int(item.get('quantity') or 0) for item in request.get('items') or []) or 1
+
+
+def _solve(stops, demands, vehicles, times, time_limit):
     """
-    Placeholder for route optimization. Returns a direct route from base to destination.
-    In a real implementation, use OR-Tools to optimize with waypoints.
+    stops: [(graph_node, kind, request_index, deadline)], kind 'start', 'pickup' or 'deliver';
+    demands[request_index] is the load a request adds between its pickup and delivery;
+    index 0 is the open-route end and indices 1..vehicles the vehicles' start stops,
+    both free to travel to or from. Returns per-vehicle lists of
+    (stop index, arrival time), or None when no solution was found.
     """
-    route = [base_location]
-    if waypoints:
-        route.extend(waypoints)
-    route.append(destination)
-    return route 
\ No newline at end of file
+    def travel(i, j):
+        if stops[i][1] in ('start', 'end') or stops[j][1] in ('start', 'end'):
+            return 0
+        t = times[(stops[i][0], stops[j][0])]
+        return int(t * TIME_SCALE) if t != float('inf') else DROP_PENALTY
+
+    manager = pywrapcp.RoutingIndexManager(len(stops), vehicles, list(range(1, vehicles + 1)), [0] * vehicles)
+    model = pywrapcp.RoutingModel(manager)
+
+    def time_callback(from_index, to_index):
+        return travel(manager.IndexToNode(from_index), manager.IndexToNode(to_index))
+    transit = model.RegisterTransitCallback(time_callback)
+    model.SetArcCostEvaluatorOfAllVehicles(transit)
+    horizon = int(ROUTE_HORIZON * TIME_SCALE)
+    model.AddDimension(transit, horizon, horizon, True, 'Time')
+    time_dim = model.GetDimensionOrDie('Time')
+
+    def demand_callback(from_index):
+        _, kind, request_index, _ = stops[manager.IndexToNode(from_index)]
+        if kind == 'pickup':
+            return demands[request_index]
+        if kind == 'deliver':
+            return -demands[request_index]
+        return 0
+    capacity = model.RegisterUnaryTransitCallback(demand_callback)
+    model.AddDimensionWithVehicleCapacity(capacity, 0, [VEHICLE_CAPACITY] * vehicles, True, 'Capacity')
+
+    pairs = {}
+    for i, (_, kind, request_index, deadline) in enumerate(stops):
+        if kind in ('pickup', 'deliver'):
+            pairs.setdefault(request_index, {})[kind] = manager.NodeToIndex(i)
+            if deadline is not None:
+                time_dim.CumulVar(manager.NodeToIndex(i)).SetMax(int(deadline * TIME_SCALE))
+    solver = model.solver()
+    for pair in pairs.values():
+        pickup, deliver = pair['pickup'], pair['deliver']
+        model.AddPickupAndDelivery(pickup, deliver)
+        solver.Add(model.VehicleVar(pickup) == model.VehicleVar(deliver))
+        solver.Add(time_dim.CumulVar(pickup) <= time_dim.CumulVar(deliver))
+        # A pair is performed or dropped as a whole, so one disjunction carries the penalty
+        model.AddDisjunction([pickup], DROP_PENALTY)
+        model.AddDisjunction([deliver], 0)
+
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PARALLEL_CHEAPEST_INSERTION
+    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    params.time_limit.FromMilliseconds(int(time_limit * 1000))
+    solution = model.SolveWithParameters(params)
+    if solution is None:
+        return None
+
+    runs = []
+    for v in range(vehicles):
+        index = model.Start(v)
+        run = []
+        while not model.IsEnd(index):
+            run.append((manager.IndexToNode(index), solution.Value(time_dim.CumulVar(index)) / TIME_SCALE))
+            index = solution.Value(model.NextVar(index))
+        runs.append(run)
+    return runs
+
+
+def plan_deliveries(requests, drivers, time_limit=SOLVE_SECONDS):
+    """
+    Consolidated runs for `requests` (resource requests) over `drivers`. Returns
+    {'routes': [{'driver', 'stops': [{'request_id', 'action', 'location', 'node', 'eta'}],
+                 'load', 'duration'}],
+     'unassigned': [request_id, ...], 'skipped': [request_id, ...]}; drivers with
+    nothing to carry are left out. Skipped requests pick up and deliver at the same
+    node (usually a base slot the gazetteer could not tell apart from the destination).
+    """
+    ends, routable, skipped = [], [], []
+    for req in requests:
+        pickup = location_node(req.get('base_location'), role='origin')
+        deliver = location_node(req.get('destination'))
+        if pickup == deliver:
+            skipped.append(req.get('request_id'))
+        else:
+            routable.append(req)
+            ends.append((pickup, deliver))
+    requests = routable
+    if not requests or not drivers:
+        return {'routes': [], 'unassigned': [r.get('request_id') for r in requests], 'skipped': skipped}
+    stops = [(None, 'end', None, None)] + [(None, 'start', None, None)] * len(drivers)
+    for i, req in enumerate(requests):
+        deadline = URGENT_DEADLINE if req.get('priority') == 1 else None
+        pickup, deliver = ends[i]
+        stops.append((pickup, 'pickup', i, None))
+        stops.append((deliver, 'deliver', i, deadline))
+    times = travel_times([stop[0] for stop in stops if stop[0] is not None])
+    demands = [request_demand(req) for req in requests]
+    runs = _solve(stops, demands, len(drivers), times, time_limit)
+
+    routes, served = [], set()
+    for driver, run in zip(drivers, runs or []):
+        plan = []
+        for stop_index, eta in run:
+            node, kind, request_index, _ = stops[stop_index]
+            if kind not in ('pickup', 'deliver'):
+                continue
+            req = requests[request_index]
+            served.add(request_index)
+            plan.append({
+                'request_id': req.get('request_id'),
+                'action': kind,
+                'location': req.get('base_location') if kind == 'pickup' else req.get('destination'),
+                'node': node_name(node),
+                'eta': round(eta, 2),
+            })
+        if plan:
+            load = sum(demands[i] for i in {stops[s][2] for s, _ in run if stops[s][2] is not None})
+            routes.append({'driver': {'name': driver.get('name'), 'email': driver.get('email')},
+                           'stops': plan, 'load': load, 'duration': plan[-1]['eta']})
+    unassigned = [req.get('request_id') for i, req in enumerate(requests) if i not in served]
+    return {'routes': routes, 'unassigned': unassigned, 'skipped': skipped}
+
+
+def compute_delivery_route(base_location, destination, waypoints=None, time_limit=1.0):
+    """
+    Single run from base_location to destination visiting every waypoint, in the
+    order that minimizes road time. Returns the location names in visiting order.
+    """
+    waypoints = list(waypoints or [])
+    if not waypoints:
+        return [base_location, destination]
+    locations = [base_location, destination] + waypoints
+    nodes = [location_node(base_location, role='origin')] + [location_node(name) for name in locations[1:]]
+    times = travel_times(nodes)
+
+    manager = pywrapcp.RoutingIndexManager(len(locations), 1, [0], [1])
+    model = pywrapcp.RoutingModel(manager)
+
+    def time_callback(from_index, to_index):
+        t = times[(nodes[manager.IndexToNode(from_index)], nodes[manager.IndexToNode(to_index)])]
+        return int(t * TIME_SCALE) if t != float('inf') else DROP_PENALTY
+    model.SetArcCostEvaluatorOfAllVehicles(model.RegisterTransitCallback(time_callback))
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    params.time_limit.FromMilliseconds(int(time_limit * 1000))
+    solution = model.SolveWithParameters(params)
+    if solution is None:
+        return [base_location, *waypoints, destination]
+    order, index = [], model.Start(0)
+    while True:
+        order.append(locations[manager.IndexToNode(index)])
+        if model.IsEnd(index):
+            return order
+        index = solution.Value(model.NextVar(index))
+
+
+def pending_deliveries():
+    """Approved resource requests that no driver has accepted yet."""
+    return [r for r in find_requests_by_status('resource', ['Approved']) if not r.get('assigned_driver')]
+
+
+def save_plan(plan):
+    """
+    Store each planned request's whole run (its driver's stop list) in delivery_route,
+    and clear any earlier run stored on a skipped request.
+    """
+    for request_id in plan.get('skipped', []):
+        def clear(r):
+            r['delivery_route'] = []
+            return r
+        update_request_by_id('resource', request_id, clear)
+    for route in plan['routes']:
+        for request_id in {stop['request_id'] for stop in route['stops']}:
+            def updater(r, stops=route['stops']):
+                r['delivery_route'] = stops
+                return r
+            update_request_by_id('resource', request_id, updater)
+
+
+def plan_pending_deliveries(time_limit=SOLVE_SECONDS):
+    """Plan runs for every pending delivery with the drivers on duty now, and save them."""
+    plan = plan_deliveries(pending_deliveries(), get_on_duty_drivers(), time_limit)
+    save_plan(plan)
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan consolidated delivery runs for pending requests.")
+    parser.add_argument('--time-limit', type=float, default=SOLVE_SECONDS, help="solver budget in seconds")
+    parser.add_argument('--save', action='store_true', help="store each request's planned run in delivery_route")
+    args = parser.parse_args()
+
+    plan = plan_deliveries(pending_deliveries(), get_on_duty_drivers(), args.time_limit)
+    for route in plan['routes']:
+        print(f"{route['driver']['name']}: load {route['load']}, duration {route['duration']:.1f}")
+        for stop in route['stops']:
+            print(f"  {stop['eta']:7.1f}  {stop['action']:<8} {stop['request_id']}  {stop['location']} ({stop['node']})")
+    if plan['unassigned']:
+        print(f"unassigned: {', '.join(plan['unassigned'])}")
+    if plan['skipped']:
+        print(f"skipped (base and destination are the same node): {', '.join(plan['skipped'])}")
+    if args.save:
+        save_plan(plan)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Shortest-path routing over the supply network.
+
+The MultiDiGraph from generate_route carries a road and an air edge per direction
+for every link. Routing only ever wants the cheapest composite (comp = time + cost)
+edge per ordered pair, plus the cheapest road edge by cost and fastest air edge by
+time for the metrics. collapse() reduces the graph to exactly that once; then a
+single Dijkstra from the destination over the reversed edges yields every base's
+path and metrics in one search.
+"""
+import heapq
+
+
+class CollapsedGraph:
+    """Best edges per ordered node pair: comp for routing, road/air (time, cost) for metrics."""
+
+    def __init__(self, G):
+        self.nodes = list(G.nodes)
+        self.pred = {n: {} for n in self.nodes}  # v -> {u: comp} for edges u -> v
+        self.road = {}
+        self.air = {}
+        self._pred_by = {}
+        for u, v, e in G.edges(data=True):
+            self._add(u, v, e)
+
+    def _add(self, u, v, e):
+        pair = (u, v)
+        if e['comp'] < self.pred[v].get(u, float('inf')):
+            self.pred[v][u] = e['comp']
+        if e['mode'] == 'road':
+            if pair not in self.road or e['cost'] < self.road[pair][1]:
+                self.road[pair] = (e['time'], e['cost'])
+        elif e['mode'] == 'air':
+            if pair not in self.air or e['time'] < self.air[pair][0]:
+                self.air[pair] = (e['time'], e['cost'])
+
+    def refresh(self, G, u, v):
+        """Recompute the best edges for the ordered pair (u, v) after its edges in G changed."""
+        pair = (u, v)
+        self.pred[v].pop(u, None)
+        self.road.pop(pair, None)
+        self.air.pop(pair, None)
+        for e in (G.get_edge_data(u, v) or {}).values():
+            self._add(u, v, e)
+        for weight, pred in self._pred_by.items():
+            mode, field = weight.split('_')
+            values = (self.road if mode == 'road' else self.air).get(pair)
+            if values is None:
+                pred[v].pop(u, None)
+            else:
+                pred[v][u] = values[0 if field == 'time' else 1]
+
+    def predecessors(self, weight='comp'):
+        """v -> {u: weight of u -> v}. weight is 'comp', or 'road_time'/'road_cost'/'air_time'/'air_cost'."""
+        if weight == 'comp':
+            return self.pred
+        if weight not in self._pred_by:
+            mode, field = weight.split('_')
+            edges, col = (self.road if mode == 'road' else self.air), (0 if field == 'time' else 1)
+            pred = {n: {} for n in self.nodes}
+            for (u, v), values in edges.items():
+                pred[v][u] = values[col]
+            self._pred_by[weight] = pred
+        return self._pred_by[weight]
+
+
+def collapse(G):
+    return CollapsedGraph(G)
+
+
+def shortest_path_tree(cg, dest, terminals=(), weight='comp'):
+    """
+    Dijkstra from `dest` over reversed edges. Returns (dist, next_hop): the distance
+    (by `weight`, see CollapsedGraph.predecessors) from each reachable node to
+    `dest`, and the next node on its path.
+    Nodes in `terminals` (the main bases) are reached but never expanded, so no
+    path passes through a main on its way to `dest`.
+    """
+    terminals = set(terminals)
+    pred = cg.predecessors(weight)
+    dist = {dest: 0.0}
+    next_hop = {dest: None}
+    heap = [(0.0, dest)]
+    done = set()
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in done:
+            continue
+        done.add(v)
+        if v in terminals and v != dest:
+            continue
+        for u, w in pred[v].items():
+            nd = d + w
+            if nd < dist.get(u, float('inf')):
+                dist[u] = nd
+                next_hop[u] = v
+                heapq.heappush(heap, (nd, u))
+    return dist, next_hop
+
+
+def path_from(next_hop, source):
+    """Node list from `source` to the tree's root, or [] if `source` is unreachable."""
+    if source not in next_hop:
+        return []
+    path = [source]
+    while next_hop[path[-1]] is not None:
+        path.append(next_hop[path[-1]])
+    return path
+
+
+def path_metrics(cg, path):
+    """
+    (t_road, c_road, t_air, c_air) along a path, using the best road/air edge per hop.
+    A hop with no edge of a mode (e.g. its road closed) makes that mode's totals inf.
+    """
+    missing = (float('inf'), float('inf'))
+    t_r = c_r = t_a = c_a = 0.0
+    for u, v in zip(path, path[1:]):
+        t, c = cg.road.get((u, v), missing)
+        t_r += t; c_r += c
+        t, c = cg.air.get((u, v), missing)
+        t_a += t; c_a += c
+    return t_r, c_r, t_a, c_a
+
+
+def hop_modes(cg, path, priority):
+    """
+    [(u, v, 'A' or 'R')] along a path: the priority's mode (air for 1, road otherwise),
+    or the other mode on hops where the preferred one has no edge.
+    """
+    preferred, fallback = (('A', cg.air), ('R', cg.road)) if priority == 1 else (('R', cg.road), ('A', cg.air))
+    return [(u, v, preferred[0] if (u, v) in preferred[1] else fallback[0]) for u, v in zip(path, path[1:])]
+
+
+def route_table(cg, dest, sources, priority, tree=None):
+    """
+    Composite-optimal route from every source (main base) to `dest`.
+    Returns (paths, metrics, edge_mode, best_bal) in generate_route's format.
+    `tree` is a precomputed shortest_path_tree(cg, dest, terminals=sources).
+    """
+    dist, next_hop = tree or shortest_path_tree(cg, dest, terminals=sources)
+    paths, metrics, edge_mode = {}, {}, {}
+    for m in sources:
+        path = path_from(next_hop, m)
+        paths[m] = path
+        metrics[m] = path_metrics(cg, path) if path else (0.0, 0.0, 0.0, 0.0)
+        edge_mode[m] = hop_modes(cg, path, priority)
+    reachable = [m for m in sources if paths[m]]
+    best_bal = min(reachable, key=lambda m: dist[m]) if reachable else sources[0]
+    return paths, metrics, edge_mode, best_bal
@@ -1,45 +1,65 @@
+import threading
 from datetime import datetime, timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from data_utils import load_requests, update_request_by_id
+from data_utils import (archive_closed_requests, find_requests_by_status,
+                        update_request_by_id)
+import status_feed
 from email_utils import send_notification_email
+from route_optimizer import plan_pending_deliveries
+from token_store import approval_tokens, driver_tokens
 
 REMINDER_HOURS = 24
+# How often approved, unassigned deliveries are re-planned into consolidated runs
+ROUTE_PLAN_MINUTES = 15
+
+# app.py calls start_scheduler() on every Streamlit rerun; only the first call starts one
+_scheduler = None
+_scheduler_lock = threading.Lock()
 
 
 def check_stalled_requests():
     now = datetime.now()
     for req_type in ['resource', 'service']:
-        requests = load_requests(req_type)
+        requests = find_requests_by_status(req_type, ["Pending", "Approved", "In Progress"])
         for req in requests:
-            status = req.get('status')
             request_date = req.get('request_date')
             last_update = req.get('last_update_time', request_date)
-            if status in ["Pending", "Approved", "In Progress"]:
-                # If more than REMINDER_HOURS since last update, send reminder
-                if last_update:
-                    try:
-                        last_dt = datetime.fromisoformat(last_update)
-                    except Exception:
-                        last_dt = now
-                    if (now - last_dt) > timedelta(hours=REMINDER_HOURS):
-                        to_email = req.get('manager', {}).get('email')
-                        if to_email:
-                            send_notification_email(
-                                to_email,
-                                f"Reminder: Request {req.get('request_id')} is stalled",
-                                f"Request {req.get('request_id')} has not been updated in over {REMINDER_HOURS} hours. Please review."
-                            )
-                            # Update last_update_time to avoid spamming
-                            def updater(r):
-                                r['last_update_time'] = now.isoformat()
-                                return r
-                            update_request_by_id(req_type, req.get('request_id'), updater)
+            # If more than REMINDER_HOURS since last update, send reminder
+            if last_update:
+                try:
+                    last_dt = datetime.fromisoformat(last_update)
+                except Exception:
+                    last_dt = now
+                if (now - last_dt) > timedelta(hours=REMINDER_HOURS):
+                    to_email = req.get('manager', {}).get('email')
+                    if to_email:
+                        send_notification_email(
+                            to_email,
+                            f"Reminder: Request {req.get('request_id')} is stalled",
+                            f"Request {req.get('request_id')} has not been updated in over {REMINDER_HOURS} hours. Please review."
+                        )
+                        # Update last_update_time to avoid spamming
+                        def updater(r):
+                            r['last_update_time'] = now.isoformat()
+                            return r
+                        update_request_by_id(req_type, req.get('request_id'), updater)
 
 
 def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(check_stalled_requests, 'interval', hours=1)
-    scheduler.start()
-    return scheduler 
\ No newline at end of file
+    """Start the background jobs once per process and return the scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(check_stalled_requests, 'interval', hours=1)
+        scheduler.add_job(approval_tokens.compact, 'interval', hours=1)
+        scheduler.add_job(driver_tokens.compact, 'interval', hours=1)
+        scheduler.add_job(status_feed.trim, 'interval', hours=1)
+        scheduler.add_job(archive_closed_requests, 'interval', hours=24)
+        scheduler.add_job(plan_pending_deliveries, 'interval', minutes=ROUTE_PLAN_MINUTES)
+        scheduler.start()
+        _scheduler = scheduler
+    return _scheduler
@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import journal_store
+
+DB_FILE = os.getenv('SQLITE_PATH', os.path.join('data', 'requests.db'))
+JSON_FILES = {
+    'resource': os.path.join('data', 'resource_requests.json'),
+    'service': os.path.join('data', 'service_requests.json'),
+}
+TABLES = {'resource': 'resource_requests', 'service': 'service_requests'}
+
+_local = threading.local()
+
+
+def _table(request_type):
+    return TABLES['resource' if request_type == 'resource' else 'service']
+
+
+def _init_schema(conn):
+    for table in TABLES.values():
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                request_id TEXT NOT NULL UNIQUE,
+                status TEXT,
+                request_date TEXT,
+                last_update_time TEXT,
+                data TEXT NOT NULL
+            )""")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status ON {table}(status)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_request_date ON {table}(request_date)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_update ON {table}(last_update_time)")
+
+
+def get_connection():
+    """Return this thread's connection, opening it (WAL mode) on first use."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        directory = os.path.dirname(DB_FILE)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions below
+        conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _init_schema(conn)
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+def _row_values(request):
+    return (
+        request.get('request_id'),
+        request.get('status'),
+        request.get('request_date'),
+        request.get('last_update_time'),
+        json.dumps(request),
+    )
+
+
+def _upsert(conn, table, request):
+    conn.execute(
+        f"""INSERT INTO {table} (request_id, status, request_date, last_update_time, data)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(request_id) DO UPDATE SET
+                status = excluded.status,
+                request_date = excluded.request_date,
+                last_update_time = excluded.last_update_time,
+                data = excluded.data""",
+        _row_values(request))
+
+
+def load_requests(request_type):
+    conn = get_connection()
+    rows = conn.execute(f"SELECT data FROM {_table(request_type)} ORDER BY seq")
+    return [json.loads(data) for (data,) in rows]
+
+
+def save_requests(request_type, requests):
+    conn = get_connection()
+    table = _table(request_type)
+    with _transaction(conn):
+        conn.execute(f"DELETE FROM {table}")
+        for request in requests:
+            _upsert(conn, table, request)
+
+
+def add_request(request_type, request_data):
+    conn = get_connection()
+    with _transaction(conn):
+        _upsert(conn, _table(request_type), request_data)
+
+
+def add_requests(request_type, requests_data):
+    conn = get_connection()
+    table = _table(request_type)
+    with _transaction(conn):
+        for request in requests_data:
+            _upsert(conn, table, request)
+
+
+def find_request_by_id(request_type, request_id):
+    conn = get_connection()
+    row = conn.execute(
+        f"SELECT data FROM {_table(request_type)} WHERE request_id = ?", (request_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def find_requests_by_status(request_type, statuses):
+    conn = get_connection()
+    statuses = list(statuses)
+    placeholders = ', '.join('?' for _ in statuses)
+    rows = conn.execute(
+        f"SELECT data FROM {_table(request_type)} WHERE status IN ({placeholders}) ORDER BY seq",
+        statuses)
+    return [json.loads(data) for (data,) in rows]
+
+
+def update_request_by_id(request_type, request_id, update_fn):
+    conn = get_connection()
+    table = _table(request_type)
+    with _transaction(conn):
+        row = conn.execute(f"SELECT data FROM {table} WHERE request_id = ?", (request_id,)).fetchone()
+        if not row:
+            return False
+        _upsert(conn, table, update_fn(json.loads(row[0])))
+    return True
+
+
+def extract_requests(request_type, predicate, sink):
+    conn = get_connection()
+    table = _table(request_type)
+    with _transaction(conn):
+        rows = conn.execute(f"SELECT data FROM {table} ORDER BY seq")
+        moved = [req for req in (json.loads(data) for (data,) in rows) if predicate(req)]
+        if moved:
+            sink(moved)
+            conn.executemany(f"DELETE FROM {table} WHERE request_id = ?",
+                             [(req.get('request_id'),) for req in moved])
+    return moved
+
+
+def migrate_from_json(json_files=None):
+    """
+    One-shot import of the JSON request files (plus any pending journal) into SQLite.
+    Existing rows with the same request_id are overwritten. Returns {type: count}.
+    """
+    json_files = json_files or JSON_FILES
+    conn = get_connection()
+    counts = {}
+    for request_type, path in json_files.items():
+        requests = journal_store.replay(path)
+        table = _table(request_type)
+        with _transaction(conn):
+            for request in requests:
+                _upsert(conn, table, request)
+        counts[request_type] = len(requests)
+    return counts
+
+
+if __name__ == '__main__':
+    for request_type, count in migrate_from_json().items():
+        print(f"Migrated {count} {request_type} requests into {DB_FILE}")
@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+from file_utils import file_lock
+
+FEED_FILE = os.path.join('data', 'status_events.jsonl')
+FEED_MAX_BYTES = int(os.getenv('STATUS_FEED_MAX_BYTES', 1024 * 1024))
+# How often a subscribed process checks the feed file for events written by other processes
+FEED_WATCH_INTERVAL = float(os.getenv('STATUS_FEED_WATCH_INTERVAL', 0.25))
+FEED_BUFFER_SIZE = 2048
+
+
+def publish(request_type, request_id, status, assigned_driver=None):
+    """Append a status-change event to the feed shared by all processes."""
+    event = {
+        'type': request_type,
+        'request_id': request_id,
+        'status': status,
+        'assigned_driver': assigned_driver,
+        'time': time.time(),
+    }
+    with file_lock(FEED_FILE):
+        with open(FEED_FILE, 'a') as f:
+            f.write(json.dumps(event) + '\n')
+    feed.notify()
+
+
+def trim(max_bytes=FEED_MAX_BYTES):
+    """Keep only the newest half of the feed once it exceeds max_bytes. Subscribers see a reset."""
+    with file_lock(FEED_FILE):
+        if not os.path.exists(FEED_FILE) or os.path.getsize(FEED_FILE) <= max_bytes:
+            return
+        with open(FEED_FILE, 'rb') as f:
+            f.seek(os.path.getsize(FEED_FILE) - max_bytes // 2)
+            f.readline()  # skip the partial line
+            tail = f.read()
+        tmp = FEED_FILE + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(tail)
+        os.replace(tmp, FEED_FILE)
+
+
+class StatusFeed:
+    """
+    Per-process view of the feed file. Events are buffered in memory with a cursor
+    of the form '<inode>:<offset>'. Subscribers block on a condition variable and are
+    woken only when new events arrive, either published by this process or picked
+    up from the file by a single watcher thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=FEED_BUFFER_SIZE)  # (offset, event)
+        self._inode = None
+        self._offset = 0
+        self._floor = 0  # events ending at or before this offset were evicted from the buffer
+        self._watcher = None
+
+    def _cursor(self):
+        return f"{self._inode}:{self._offset}"
+
+    def _read_new(self):
+        """Pull new lines from the file into the buffer. Caller holds self._cond."""
+        if not os.path.exists(self.path):
+            # Create the file up front so cursors handed out now stay valid after the first publish
+            with open(self.path, 'a'):
+                pass
+        st = os.stat(self.path)
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # New or trimmed file: start over, subscribers on the old inode get a reset
+            self._inode, self._offset, self._floor = st.st_ino, 0, 0
+            self._events.clear()
+        if st.st_size == self._offset:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        # Only consume complete lines; a partially written one is picked up next time
+        complete = data[:data.rfind(b'\n') + 1]
+        for line in complete.splitlines(keepends=True):
+            self._offset += len(line)
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0][0]
+            self._events.append((self._offset, event))
+        return bool(complete)
+
+    def notify(self):
+        with self._cond:
+            if self._read_new():
+                self._cond.notify_all()
+
+    def _watch(self):
+        while True:
+            time.sleep(FEED_WATCH_INTERVAL)
+            self.notify()
+
+    def _ensure_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    def wait_for(self, request_ids, since=None, timeout=25.0):
+        """
+        Block until an event for one of `request_ids` arrives after cursor `since`.
+        Returns {'cursor', 'events', 'reset'}. With no `since`, returns the current
+        cursor immediately. `reset` means events may have been missed and the caller
+        should re-read the statuses it cares about.
+        """
+        request_ids = set(request_ids)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._ensure_watcher()
+            self._read_new()
+            if not since:
+                return {'cursor': self._cursor(), 'events': [], 'reset': False}
+            inode, _, offset = since.partition(':')
+            offset = int(offset or 0)
+            while True:
+                if inode != str(self._inode) or offset < self._floor:
+                    return {'cursor': self._cursor(), 'events': [], 'reset': True}
+                events = [e for o, e in self._events if o > offset and e.get('request_id') in request_ids]
+                if events:
+                    return {'cursor': self._cursor(), 'events': events, 'reset': False}
+                offset = self._offset
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return {'cursor': self._cursor(), 'events': [], 'reset': False}
+                self._cond.wait(remaining)
+
+
+feed = StatusFeed(FEED_FILE)
+
+
+def wait_for_status_change(base_url, request_ids, cursor=None, timeout=25.0):
+    """
+    Client side of the approval server's /status_events long-poll. Returns the
+    server's response dict, or None if the server could not be reached.
+    """
+    params = {'ids': ','.join(request_ids), 'timeout': timeout}
+    if cursor:
+        params['since'] = cursor
+    try:
+        response = requests.get(f"{base_url}/status_events", params=params, timeout=timeout + 5)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return None
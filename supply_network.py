@@ -0,0 +1,279 @@
+"""
+Array-backed supply network for large deployments (thousands of mobile units).
+
+generate_route builds a 3-main / 15-mobile NetworkX graph with an O(n^2) neighbour
+search. This module generates the same kind of network at any size:
+
+  - node coordinates in one (n, 2) array, mains first;
+  - neighbour candidates from a uniform grid (spatial hash), distances computed
+    with NumPy per candidate block;
+  - links stored CSR-style: indptr/indices plus road/air time and cost columns,
+    each undirected link stored once per direction;
+  - Dijkstra over those arrays with a binary heap, no per-edge dicts.
+
+Topology does not depend on the destination, so one network serves every route.
+
+    python supply_network.py --mobile 10000
+"""
+import argparse
+import heapq
+import math
+import time
+
+import numpy as np
+
+SEED = 42
+MAX_NEIGHBORS = 4
+ROAD_SPEED = 1.0
+AIR_SPEED = 3.0
+ROAD_COST_UNIT = 1.0
+AIR_COST_UNIT = 3.0
+# Mobile units per unit area, matching generate_route's 15 units on a 20x20 square
+DENSITY = 15 / 400.0
+
+
+class SupplyNetwork:
+    """CSR supply network. Node ids 0..num_main-1 are main bases, the rest mobile units."""
+
+    def __init__(self, coords, num_main, links, rng):
+        self.coords = coords
+        self.num_main = num_main
+        self.num_nodes = len(coords)
+        u, v = links[:, 0], links[:, 1]
+        dist = np.hypot(*(coords[u] - coords[v]).T)
+        k = len(links)
+        road_time = dist / ROAD_SPEED * rng.uniform(1.0, 1.5, k)
+        road_cost = dist * ROAD_COST_UNIT * rng.uniform(0.5, 1.0, k)
+        air_time = dist / AIR_SPEED * rng.uniform(0.5, 1.0, k)
+        air_cost = dist * AIR_COST_UNIT * rng.uniform(1.0, 1.5, k)
+        # Both directions, grouped by source node
+        src = np.concatenate([u, v])
+        dst = np.concatenate([v, u])
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=self.num_nodes))])
+        self.road_time = np.concatenate([road_time, road_time])[order]
+        self.road_cost = np.concatenate([road_cost, road_cost])[order]
+        self.air_time = np.concatenate([air_time, air_time])[order]
+        self.air_cost = np.concatenate([air_cost, air_cost])[order]
+        self.comp = np.minimum(self.road_time + self.road_cost, self.air_time + self.air_cost)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def links(self):
+        """Each undirected link once, as a (k, 2) array of node ids (u < v)."""
+        src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+        keep = src < self.indices
+        return np.stack([src[keep], self.indices[keep]], axis=1)
+
+    def edge_index(self, u, v):
+        """Position of the directed edge u -> v in the edge arrays, or -1."""
+        start, end = self.indptr[u], self.indptr[u + 1]
+        hits = np.nonzero(self.indices[start:end] == v)[0]
+        return start + hits[0] if len(hits) else -1
+
+    def shortest_path_tree(self, dest, terminals=None):
+        """
+        Dijkstra from `dest` on comp weights (links are symmetric, so this is also
+        the reversed graph). Returns (dist, next_hop) arrays; next_hop is -1 for the
+        root and unreachable nodes. Main bases are settled but not expanded unless
+        `terminals` says otherwise, so no path transits a main.
+        """
+        if terminals is None:
+            terminals = range(self.num_main)
+        n = self.num_nodes
+        indptr, indices, comp = self.indptr.tolist(), self.indices.tolist(), self.comp.tolist()
+        stop = [False] * n
+        for t in terminals:
+            stop[t] = True
+        stop[dest] = False
+        dist = [math.inf] * n
+        next_hop = [-1] * n
+        done = [False] * n
+        dist[dest] = 0.0
+        heap = [(0.0, dest)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if done[v]:
+                continue
+            done[v] = True
+            if stop[v]:
+                continue
+            for e in range(indptr[v], indptr[v + 1]):
+                u = indices[e]
+                nd = d + comp[e]
+                if nd < dist[u]:
+                    dist[u] = nd
+                    next_hop[u] = v
+                    heapq.heappush(heap, (nd, u))
+        return np.array(dist), np.array(next_hop)
+
+    def path_from(self, next_hop, source, dest):
+        if source != dest and next_hop[source] < 0:
+            return []
+        path = [source]
+        while path[-1] != dest:
+            path.append(int(next_hop[path[-1]]))
+        return path
+
+    def path_metrics(self, path):
+        """(t_road, c_road, t_air, c_air) along a path."""
+        edges = [self.edge_index(u, v) for u, v in zip(path, path[1:])]
+        return (float(self.road_time[edges].sum()), float(self.road_cost[edges].sum()),
+                float(self.air_time[edges].sum()), float(self.air_cost[edges].sum()))
+
+    def route_table(self, dest, priority):
+        """(paths, metrics, edge_mode, best_bal) from every main to `dest`, as in generate_route."""
+        dist, next_hop = self.shortest_path_tree(dest)
+        sel = 'A' if priority == 1 else 'R'
+        mains = list(range(self.num_main))
+        paths, metrics, edge_mode = {}, {}, {}
+        for m in mains:
+            path = self.path_from(next_hop, m, dest)
+            paths[m] = path
+            metrics[m] = self.path_metrics(path) if path else (0.0, 0.0, 0.0, 0.0)
+            edge_mode[m] = [(u, v, sel) for u, v in zip(path, path[1:])]
+        reachable = [m for m in mains if paths[m]]
+        best_bal = min(reachable, key=lambda m: dist[m]) if reachable else mains[0]
+        return paths, metrics, edge_mode, best_bal
+
+    def to_multidigraph(self):
+        """The equivalent generate_route-style NetworkX MultiDiGraph (for drawing or cross-checks)."""
+        import networkx as nx
+
+        G = nx.MultiDiGraph()
+        for i, (x, y) in enumerate(self.coords.tolist()):
+            G.add_node(i, pos=(x, y))
+        src = np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+        for u, v, t_r, c_r, t_a, c_a in zip(src.tolist(), self.indices.tolist(),
+                                              self.road_time.tolist(), self.road_cost.tolist(),
+                                              self.air_time.tolist(), self.air_cost.tolist()):
+            G.add_edge(u, v, mode='road', time=t_r, cost=c_r, comp=t_r + c_r)
+            G.add_edge(u, v, mode='air', time=t_a, cost=c_a, comp=t_a + c_a)
+        return G
+
+
+class GridIndex:
+    """Uniform-grid spatial hash over a coordinate array."""
+
+    def __init__(self, coords, cell):
+        self.coords = coords
+        self.cell = cell
+        keys = np.floor(coords / cell).astype(np.int64)
+        cells, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(inverse.ravel(), minlength=len(cells)))])
+        self.keys = keys
+        self.buckets = {(int(cx), int(cy)): order[bounds[i]:bounds[i + 1]]
+                        for i, (cx, cy) in enumerate(cells)}
+
+    def candidates(self, point, rings=1):
+        cx, cy = np.floor(np.asarray(point) / self.cell).astype(np.int64)
+        found = [self.buckets.get((cx + dx, cy + dy)) for dx in range(-rings, rings + 1)
+                 for dy in range(-rings, rings + 1)]
+        found = [b for b in found if b is not None]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def nearest(self, point, k=1, exclude=None):
+        """
+        Up to k nearest indices to `point`. The search ring widens until it holds k
+        candidates and the k-th distance is within the ring: every point outside
+        `rings` cells of the query's cell is at least rings * cell away.
+        """
+        available = len(self.coords) - (exclude is not None)
+        rings = 1
+        while True:
+            cand = self.candidates(point, rings)
+            if exclude is not None:
+                cand = cand[cand != exclude]
+            complete = len(cand) >= available
+            if len(cand) >= k or complete:
+                d = np.hypot(*(self.coords[cand] - point).T)
+                if len(cand) > k:
+                    keep = np.argpartition(d, k - 1)[:k]
+                    cand, d = cand[keep], d[keep]
+                reach = d.max() if len(d) else 0.0
+                if complete or reach <= rings * self.cell:
+                    break
+                # One more pass with a ring wide enough to hold everything nearer than `reach`
+                rings = max(rings + 1, int(math.ceil(reach / self.cell)))
+            else:
+                rings *= 2
+        order = np.argsort(d, kind='stable')
+        return cand[order], d[order]
+
+
+def generate(num_mobile, num_main=3, max_neighbors=MAX_NEIGHBORS, seed=SEED, main_coords=None):
+    """
+    Random supply network with `num_mobile` units spread at generate_route's density.
+    Mobile units are chained along a serpentine grid order (so the network is
+    connected) and then linked to their nearest neighbours up to `max_neighbors`;
+    mains link to their nearest mobile units and never to each other.
+    """
+    rng = np.random.default_rng(seed)
+    extent = math.sqrt(num_mobile / DENSITY)
+    mobile = rng.random((num_mobile, 2)) * extent
+    if main_coords is None:
+        main_coords = rng.random((num_main, 2)) * extent
+    coords = np.vstack([np.asarray(main_coords, dtype=float).reshape(-1, 2), mobile])
+    num_main = len(coords) - num_mobile
+
+    # About four units per cell keeps the 3x3 candidate block small
+    cell = math.sqrt(4 / DENSITY)
+    index = GridIndex(mobile, cell)
+    degree = np.zeros(len(coords), dtype=np.int64)
+    links = set()
+
+    def link(i, j):
+        if i == j or degree[i] >= max_neighbors or degree[j] >= max_neighbors:
+            return
+        pair = (i, j) if i < j else (j, i)
+        if pair not in links:
+            links.add(pair)
+            degree[i] += 1
+            degree[j] += 1
+
+    # Serpentine walk over grid rows keeps consecutive units close together
+    keys = index.keys
+    snake = np.where(keys[:, 1] % 2 == 0, keys[:, 0], -keys[:, 0])
+    chain = np.lexsort((snake, keys[:, 1])) + num_main
+    for a, b in zip(chain[:-1].tolist(), chain[1:].tolist()):
+        link(a, b)
+    for m in range(num_main):
+        near, _ = index.nearest(coords[m], k=max_neighbors)
+        for j in rng.permutation(near + num_main)[:rng.integers(1, max_neighbors + 1)].tolist():
+            link(m, j)
+    for i in rng.permutation(num_mobile).tolist():
+        near, _ = index.nearest(mobile[i], k=max_neighbors + 1, exclude=i)
+        for j in (near + num_main).tolist():
+            link(i + num_main, j)
+
+    return SupplyNetwork(coords, num_main, np.array(sorted(links), dtype=np.int64).reshape(-1, 2), rng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a supply network and time routing on it.")
+    parser.add_argument('--mobile', type=int, default=10000)
+    parser.add_argument('--main', type=int, default=3)
+    parser.add_argument('--routes', type=int, default=20, help="destinations to route to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    net = generate(args.mobile, args.main)
+    built = time.perf_counter() - start
+    print(f"{net.num_nodes} nodes, {net.num_edges // 2} links, generated in {built * 1000:.0f} ms")
+    rng = np.random.default_rng(0)
+    dests = rng.integers(net.num_main, net.num_nodes, args.routes)
+    start = time.perf_counter()
+    reachable = 0
+    for dest in dests.tolist():
+        paths, _, _, best = net.route_table(dest, priority=1)
+        reachable += bool(paths[best])
+    per_route = (time.perf_counter() - start) / len(dests)
+    print(f"route table: {per_route * 1000:.1f} ms per destination ({reachable}/{len(dests)} reachable)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+import journal_store
+from file_utils import atomic_write_json, file_lock
+
+load_dotenv()
+
+APPROVAL_TOKEN_FILE = os.path.join('data', 'approval_tokens.json')
+APPROVAL_TOKEN_TTL_HOURS = float(os.getenv('APPROVAL_TOKEN_TTL_HOURS', 72))
+DRIVER_TOKEN_FILE = os.path.join('data', 'driver_tokens.json')
+DRIVER_TOKEN_TTL_HOURS = float(os.getenv('DRIVER_TOKEN_TTL_HOURS', 72))
+
+
+class TokenStore:
+    """
+    Token -> info mapping kept in memory for O(1) lookups and persisted as a JSON
+    snapshot (the original `{token: info}` format) plus an append-only JSONL journal
+    of 'issue'/'consume' entries. Every token carries an `expires_at` timestamp;
+    compact() drops expired and consumed tokens from the snapshot.
+    """
+
+    def __init__(self, path, ttl_hours):
+        self.path = path
+        self.journal = journal_store.journal_path(path)
+        self.ttl = timedelta(hours=ttl_hours)
+        self._lock = threading.Lock()
+        self._signature = None
+        self._tokens = {}
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.path, self.journal):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _read(self):
+        tokens = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                tokens = json.load(f)
+        if os.path.exists(self.journal):
+            with open(self.journal, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get('op') == 'issue':
+                        tokens[entry['token']] = entry['info']
+                    elif entry.get('op') == 'consume':
+                        tokens.pop(entry['token'], None)
+        return tokens
+
+    def _refresh(self):
+        """Reload from disk only if another process changed the files. Caller holds self._lock."""
+        signature = self._file_signature()
+        if signature != self._signature:
+            self._tokens = self._read()
+            self._signature = signature
+
+    def _append(self, entries):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.journal, 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _expired(self, info, now):
+        expires_at = info.get('expires_at')
+        return bool(expires_at) and datetime.fromisoformat(expires_at) <= now
+
+    def get(self, token, now=None):
+        """Return the info stored for a live token, or None."""
+        if not token:
+            return None
+        now = now or datetime.now()
+        with self._lock:
+            self._refresh()
+            info = self._tokens.get(token)
+        if info is None or self._expired(info, now):
+            return None
+        return dict(info)
+
+    def issue_many(self, infos, now=None):
+        """Create one token per info dict in a single write and return the tokens in order."""
+        tokens = [str(uuid4()) for _ in infos]
+        self.put_many(dict(zip(tokens, infos)), now)
+        return tokens
+
+    def put_many(self, token_infos, now=None):
+        """Store caller-chosen tokens ({token: info}) in a single write."""
+        now = now or datetime.now()
+        expires_at = (now + self.ttl).isoformat()
+        entries = []
+        for token, info in token_infos.items():
+            entries.append({'op': 'issue', 'token': token, 'info': dict(info, expires_at=expires_at)})
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            self._append(entries)
+            for entry in entries:
+                self._tokens[entry['token']] = entry['info']
+            self._signature = self._file_signature()
+            self._maybe_compact(now)
+
+    def issue(self, info, now=None):
+        return self.issue_many([info], now)[0]
+
+    def consume(self, token, now=None):
+        """
+        Atomically remove a live token and return its info. Across threads and
+        processes only the first caller for a given token gets the info; later
+        callers (and callers with expired tokens) get None.
+        """
+        if not token:
+            return None
+        now = now or datetime.now()
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            info = self._tokens.get(token)
+            if info is None or self._expired(info, now):
+                return None
+            self._append([{'op': 'consume', 'token': token}])
+            del self._tokens[token]
+            self._signature = self._file_signature()
+        return dict(info)
+
+    def restore(self, token, info):
+        """Put back a token returned by consume() (e.g. when acting on it failed), keeping its expiry."""
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            self._append([{'op': 'issue', 'token': token, 'info': info}])
+            self._tokens[token] = info
+            self._signature = self._file_signature()
+
+    def _maybe_compact(self, now):
+        """Fold the journal into the snapshot once it outgrows it. Caller holds both locks."""
+        if journal_store.needs_compaction(self.path):
+            self._compact_locked(now)
+
+    def _compact_locked(self, now):
+        live = {}
+        for token, info in self._tokens.items():
+            if self._expired(info, now):
+                continue
+            if not info.get('expires_at'):
+                # Tokens written before expiry existed get a full TTL from now
+                info = dict(info, expires_at=(now + self.ttl).isoformat())
+            live[token] = info
+        removed = len(self._tokens) - len(live)
+        atomic_write_json(self.path, live)
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+        self._tokens = live
+        self._signature = self._file_signature()
+        return removed
+
+    def compact(self, now=None):
+        """Drop expired tokens and truncate the journal. Returns the number of tokens removed."""
+        now = now or datetime.now()
+        with file_lock(self.path), self._lock:
+            self._refresh()
+            return self._compact_locked(now)
+
+
+approval_tokens = TokenStore(APPROVAL_TOKEN_FILE, APPROVAL_TOKEN_TTL_HOURS)
+# Driver acceptance token -> {'type', 'id', 'driver_email'}; the reverse index used by /accept_delivery
+driver_tokens = TokenStore(DRIVER_TOKEN_FILE, DRIVER_TOKEN_TTL_HOURS)
+
+
+def backfill_driver_tokens(requests_by_type):
+    """
+    Index acceptance tokens already stored on requests (`driver_tokens` field) that
+    predate the driver token store. Only runs while data/driver_tokens.json does not exist.
+    """
+    if os.path.exists(DRIVER_TOKEN_FILE):
+        return 0
+    token_infos = {}
+    for request_type, requests in requests_by_type.items():
+        for req in requests:
+            for driver_email, token in req.get('driver_tokens', {}).items():
+                token_infos[token] = {'type': request_type, 'id': req.get('request_id'), 'driver_email': driver_email}
+    driver_tokens.put_many(token_infos)
+    # Writes the snapshot file, which marks the backfill as done
+    driver_tokens.compact()
+    return len(token_infos)